@@ -1,265 +1,158 @@
-import datetime
+import bisect
+import os
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-from queue import Queue
-import csv
-
-class BookNode:
-    def __init__(self, book):
-        self.book = book
-        self.left = None
-        self.right = None
-
-class BookBST:
-    def __init__(self):
-        self.root = None
-
-    def insert(self, book):
-        if not self.root:
-            self.root = BookNode(book)
+from tkinter import ttk, messagebox, filedialog
+
+from library_core import BookBST, CSVStorage, Library, Metrics, PersistenceWorker, SnapshotStorage
+
+class VirtualTable:
+    """Drives a Treeview that only materializes the rows currently scrolled into view."""
+
+    def __init__(self, tree, scrollbar, row, visible_rows=20):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row = row  # item -> (iid, values)
+        self.visible_rows = visible_rows
+        self.count = lambda: 0
+        self.fetch = lambda offset, limit: []
+        self.offset = 0
+
+        tree.configure(height=visible_rows)
+        scrollbar.configure(command=self.yview)
+        for event in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tree.bind(event, self.on_wheel)
+
+    def show(self, count, fetch):
+        """Display a new row source: `count()` rows, fetched with `fetch(offset, limit)`."""
+        self.count = count
+        self.fetch = fetch
+        self.offset = 0
+        self.refresh()
+
+    def refresh(self):
+        total = self.count()
+        self.offset = max(0, min(self.offset, total - self.visible_rows))
+        self.tree.delete(*self.tree.get_children())
+        for item in self.fetch(self.offset, self.visible_rows):
+            iid, values = self.row(item)
+            self.tree.insert('', 'end', iid=iid, values=values)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.visible_rows) / total))
         else:
-            self._insert(self.root, book)
+            self.scrollbar.set(0.0, 1.0)
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"/"pages")."""
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * self.count())
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.offset += int(args[1]) * step
+        self.refresh()
+
+    def on_wheel(self, event):
+        self.offset += -3 if event.num == 4 or event.delta > 0 else 3
+        self.refresh()
+        return "break"
+
+class TitleSuggestions:
+    """Debounced, ranked title suggestions for one title Entry, listed in a Listbox beside it.
+
+    Picking a suggestion fills in the title, and the best (or picked) copy's ID goes into `id_var`.
+    With `member_var` it lists copies on loan instead, that member's first (see suggest_loans()).
+    """
+
+    def __init__(self, root, library, listbox, title_var, id_var, available_first=True, delay_ms=150,
+                 member_var=None):
+        self.root = root
+        self.completer = library.title_completer()
+        self.listbox = listbox
+        self.title_var = title_var
+        self.id_var = id_var
+        self.available_first = available_first
+        self.member_var = member_var
+        self.delay_ms = delay_ms
+        self.books = []
+        self.picked = None
+        self.pending = None
+        title_var.trace("w", self.schedule)  # Trigger update when text changes
+        listbox.bind("<<ListboxSelect>>", self.pick)
+        if member_var is not None:
+            member_var.trace("w", self.schedule)  # The member's own copies move to the top
+
+    def schedule(self, *args):
+        """Look up suggestions once typing pauses, instead of on every keystroke."""
+        if self.pending is not None:
+            self.root.after_cancel(self.pending)
+        self.pending = self.root.after(self.delay_ms, self.update)
+
+    def update(self):
+        self.pending = None
+        title = self.title_var.get().strip()
+        self.listbox.delete(0, tk.END)
+        if not title:
+            self.books = []
+            self.id_var.set("")  # Clear the Book ID field if no title is entered
+            return
 
-    def _insert(self, node, book):
-        if book.title < node.book.title:
-            if node.left:
-                self._insert(node.left, book)
-            else:
-                node.left = BookNode(book)
-        else:
-            if node.right:
-                self._insert(node.right, book)  
-            else:
-                node.right = BookNode(book)
-
-    def search(self, title):
-        return self._search(self.root, title.lower())
-
-    def _search(self, node, title):
-        if not node:
-            return []
-        if title in node.book.title.lower():
-            return [node.book] + self._search(node.left, title) + self._search(node.right, title)
-        elif title < node.book.title.lower():
-            return self._search(node.left, title)
+        if self.member_var is not None:
+            self.books = self.completer.suggest_loans(title, self.member_var.get().strip())
         else:
-            return self._search(node.right, title)
-
-    def in_order(self):
-        books = []
-        self._in_order(self.root, books)
-        return books
-
-    def _in_order(self, node, books):
-        if node:
-            self._in_order(node.left, books)
-            books.append(node.book)
-            self._in_order(node.right, books)
-
-    def _remove_book(self, node, book_id):
-        """Helper method to remove a book from the BST."""
-        if not node:
-            return None
-
-        # Compare book_id as strings (since book_id is stored as a string)
-        if book_id < node.book.book_id:
-            node.left = self._remove_book(node.left, book_id)
-        elif book_id > node.book.book_id:
-            node.right = self._remove_book(node.right, book_id)
+            self.books = self.completer.suggest(title, available_first=self.available_first)
+        for book in self.books:
+            status = "Available" if book.available else f"Borrowed by {book.borrowed_by}"
+            self.listbox.insert(tk.END, f"{book.title} - {book.author} (ID {book.book_id}, {status})")
+
+        if self.picked is not None and self.picked.title == title:
+            self.id_var.set(self.picked.book_id)
+        elif self.books:
+            self.id_var.set(self.books[0].book_id)  # Display the best matching book's ID
         else:
-            # Node to be deleted found
-            if not node.left:
-                return node.right
-            if not node.right:
-                return node.left
-            # Node with two children: Get the inorder successor (smallest in the right subtree)
-            min_larger_node = self._get_min(node.right)
-            node.book = min_larger_node.book
-            node.right = self._remove_book(node.right, min_larger_node.book.book_id)
-        return node
-
-    def _get_min(self, node):
-        """Helper method to find the minimum node in a BST."""
-        while node.left:
-            node = node.left
-        return node
-
-class Book:
-    def __init__(self, title, author, book_id):
-        self.title = title
-        self.author = author
-        self.book_id = book_id
-        self.available = True
-        self.borrowed_by = None
-        self.due_date = None
-        self.waiting_list = []  # Use a list instead of Queue
-        self.borrow_count = 0
-
-class Member:
-    def __init__(self, name, member_id):
-        self.name = name
-        self.member_id = member_id
-        self.books_borrowed = []
-
-class Library:
-    def __init__(self):
-        self.books = BookBST()
-        self.members = {}
-        self.next_book_id = 1
-        self.next_member_id = 1
-
-    def add_book(self, title, author):
-        book_id = str(self.next_book_id)
-        self.next_book_id += 1
-        book = Book(title, author, book_id)
-        self.books.insert(book)
-        return book_id
-
-    def add_member(self, name):
-        member_id = str(self.next_member_id)
-        self.next_member_id += 1
-        self.members[member_id] = Member(name, member_id)
-        return member_id
-
-    def borrow_book(self, book_title, member_id, days=14):
-        if member_id not in self.members:
-            return False, "Member Not Found"
-
-        member = self.members[member_id]
-        books = self.books.search(book_title)
-
-        for book in books:
-            if book.available:
-                book.available = False
-                book.borrowed_by = member_id
-                book.due_date = datetime.datetime.now().date() + datetime.timedelta(days=days)
-                member.books_borrowed.append(book.book_id)  # Track borrowed books in the member object
-                book.borrow_count += 1  # Increment borrow count
-                return True, f"Book '{book.title}' borrowed successfully!"
-
-        # Add to waiting list
-        books[0].waiting_list.append(member_id)
-        return False, f"Book is currently unavailable. Added to the waiting list."
-
-    def return_book(self, book_id, member_id):
-        print(f"Attempting to return Book ID: {book_id} by Member ID: {member_id}")  # Debug print
-        for book in self.books.in_order():
-            print(f"Book ID: {book.book_id}, Borrowed By: {book.borrowed_by}")  # Debug print
-            if book.book_id == book_id and book.borrowed_by == member_id:
-                book.available = True
-                book.borrowed_by = None
-                book.due_date = None
-                self.members[member_id].books_borrowed.remove(book_id)  # Remove the book from the member's borrowed list
-
-                if book.waiting_list:
-                    # Get the next member from the waiting list
-                    next_member_id = book.waiting_list.pop(0)
-                    self.borrow_book(book.title, next_member_id)
-
-                return True, 'Book returned successfully.'
-        return False, 'Book not found or invalid member ID.'
-
-    def list_books(self):
-        return self.books.in_order()
-
-    def get_most_borrowed_books(self, top_n=5):
-        """Get the top N most borrowed books."""
-        all_books = self.books.in_order()
-        sorted_books = sorted(all_books, key=lambda book: book.borrow_count, reverse=True)
-        return sorted_books[:top_n]
-
-    def save_books_to_csv(self, filename="books.csv"):
-        """Save all books to a CSV file."""
-        with open(filename, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            # Write header
-            writer.writerow(["book_id", "title", "author", "available", "borrowed_by", "due_date", "borrow_count"])
-            # Write book data
-            for book in self.books.in_order():
-                writer.writerow([
-                    book.book_id,
-                    book.title,
-                    book.author,
-                    book.available,
-                    book.borrowed_by,
-                    book.due_date.strftime('%Y-%m-%d') if book.due_date else "",
-                    book.borrow_count
-                ])
-
-    def load_books_from_csv(self, filename="books.csv"):
-        """Load books from a CSV file."""
-        try:
-            with open(filename, mode="r") as file:
-                reader = csv.DictReader(file)
-                max_book_id = 0  # Track the highest book ID
-                for row in reader:
-                    book = Book(
-                        title=row["title"],
-                        author=row["author"],
-                        book_id=row["book_id"]
-                    )
-                    book.available = row["available"] == "True"
-                    book.borrowed_by = row["borrowed_by"] if row["borrowed_by"] else None
-                    book.due_date = datetime.datetime.strptime(row["due_date"], "%Y-%m-%d").date() if row["due_date"] else None
-                    book.borrow_count = int(row["borrow_count"])
-                    self.books.insert(book)
-
-                    # Update max_book_id
-                    max_book_id = max(max_book_id, int(book.book_id))
-
-                # Set next_book_id to the highest book ID + 1
-                self.next_book_id = max_book_id + 1
-        except FileNotFoundError:
-            pass  # If the file doesn't exist, start with an empty library
-
-    def save_members_to_csv(self, filename="members.csv"):
-        """Save all members to a CSV file."""
-        with open(filename, mode="w", newline="") as file:
-            writer = csv.writer(file)
-            # Write header
-            writer.writerow(["member_id", "name", "books_borrowed"])
-            # Write member data
-            for member_id, member in self.members.items():
-                writer.writerow([
-                    member_id,
-                    member.name,
-                    ",".join(member.books_borrowed)  # Save borrowed books as a comma-separated string
-                ])
-
-    def load_members_from_csv(self, filename="members.csv"):
-        """Load members from a CSV file."""
-        try:
-            with open(filename, mode="r") as file:
-                reader = csv.DictReader(file)
-                max_member_id = 0  # Track the highest member ID
-                for row in reader:
-                    member = Member(
-                        name=row["name"],
-                        member_id=row["member_id"]
-                    )
-                    # Load borrowed books as a list
-                    member.books_borrowed = row["books_borrowed"].split(",") if row["books_borrowed"] else []
-                    self.members[member.member_id] = member
-
-                    # Update max_member_id
-                    max_member_id = max(max_member_id, int(member.member_id))
+            self.id_var.set("Not Found")  # Display "Not Found" if no match
 
-                # Set next_member_id to the highest member ID + 1
-                self.next_member_id = max_member_id + 1
-        except FileNotFoundError:
-            pass  # If the file doesn't exist, start with an empty member list
+    def pick(self, event=None):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        self.picked = self.books[selection[0]]
+        self.title_var.set(self.picked.title)
 
 class LibraryApp:
-    def __init__(self, root):
+    def __init__(self, root, storage=None, virtual_threshold=50000, metrics=None):
         self.root = root
         self.root.title("Library Management System")
         self.root.geometry("1000x500")
 
         self.library = Library()
 
-        # Load data from CSV files
-        self.library.load_books_from_csv()
-        self.library.load_members_from_csv()
+        # Opt-in timing of the library operations and of the view refreshes below
+        self.metrics = metrics
+        if metrics is not None:
+            self.library.enable_metrics(metrics)
+            metrics.instrument(self, ("load_books", "load_members", "load_available_books",
+                                      "on_library_change"), "ui_")
+
+        # Load the CSV snapshot and replay changes journaled since then (or use another backend).
+        # Writes happen on a background thread so the desk never waits on the disk.
+        # A binary snapshot is mapped first, so its first page is on screen during the full load.
+        self.storage = storage or PersistenceWorker(CSVStorage())
+        preview = self.storage.preview() if hasattr(self.storage, "preview") else None
+        if preview is None:
+            self.library.open_storage(self.storage)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Catalogs above the threshold get virtual views that only render the visible rows
+        catalog_size = len(self.library.books) if preview is None else len(preview)
+        self.virtual = catalog_size > virtual_threshold
+        self.books_table = self.available_table = self.members_table = None
+
+        self.listed_keys = {}  # See _listed()
+
+        # Whether each view currently shows search results rather than everything
+        self.books_filtered = False
+        self.available_filtered = False
+        self.members_filtered = False
 
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -269,11 +162,40 @@ class LibraryApp:
         self.create_members_tab()  # Members Page remains the second tab
         self.create_books_tab()    # Books Page is now the last tab
 
+        if preview is not None:
+            if self.virtual:
+                self.show_preview(preview)  # Smaller catalogs load too quickly to need it
+            self.library.open_storage(self.storage)
+        self.report_storage_errors()
+
+        # Compaction captures the whole catalog on this thread, so it is done while the
+        # desk is quiet; the library's own size-based compaction is only a backstop
+        self.last_input = time.monotonic()
+        for sequence in ("<Any-KeyPress>", "<Any-ButtonPress>"):
+            self.root.bind_all(sequence, self._note_input, add="+")
+        self.compact_when_idle()
+
+        # Display order of the Members view, patched from change notifications
+        self.member_ids = list(self.library.members)
+
         # Refresh the UI to display the loaded data
         self.load_books()
         self.load_members()
         self.load_available_books()
 
+        # From now on only the rows touched by a change are patched
+        self.library.subscribe(self.on_library_change)
+        if preview is not None:
+            preview.close()  # load_books() no longer reads from it
+
+    def show_preview(self, preview):
+        """Draw the window with the Books view's first page read from a mapped snapshot.
+
+        Only the Books shown are built; load_books() replaces them once the library is loaded.
+        """
+        self.books_table.show(lambda: len(preview), preview.page)
+        self.root.update_idletasks()
+
     def create_books_tab(self):
         books_frame = ttk.Frame(self.notebook)
         self.notebook.add(books_frame, text="Books")
@@ -320,11 +242,13 @@ class LibraryApp:
 
         scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.books_tree.yview)
         scrollbar.pack(side="right", fill="y")
-        self.books_tree.configure(yscrollcommand=scrollbar.set)
+        if self.virtual:
+            self.books_table = VirtualTable(self.books_tree, scrollbar, self._book_row)
+        else:
+            self.books_tree.configure(yscrollcommand=scrollbar.set)
 
         ttk.Button(books_frame, text="Show All Books", command=self.load_books).pack(pady=10)
-
-        self.load_books()
+        ttk.Button(books_frame, text="Remove Selected Books", command=self.remove_books).pack(pady=(0, 10))
 
     def create_members_tab(self):
         member_frame = ttk.Frame(self.notebook)
@@ -362,14 +286,17 @@ class LibraryApp:
 
         scrollbar = ttk.Scrollbar(list_frame, orient="vertical", command=self.members_tree.yview)
         scrollbar.pack(side="right", fill="y")
-        self.members_tree.configure(yscrollcommand=scrollbar.set)
+        if self.virtual:
+            self.members_table = VirtualTable(self.members_tree, scrollbar, self._member_row)
+        else:
+            self.members_tree.configure(yscrollcommand=scrollbar.set)
 
         ttk.Button(member_frame, text="Show All Members", command=self.load_members).pack(pady=10)
 
         # Add Delete Button
         ttk.Button(member_frame, text="Delete Member", command=self.delete_member).pack(pady=10)
 
-        self.load_members()
+        ttk.Button(member_frame, text="Show Overdue Books", command=self.show_overdue_books).pack(pady=10)
 
     def create_lending_tab(self):
         lending_frame = ttk.Frame(self.notebook)
@@ -383,8 +310,11 @@ class LibraryApp:
         ttk.Label(borrow_frame, text="Book Title:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.borrow_book_title_var = tk.StringVar()
         self.borrow_book_id_var = tk.StringVar()
-        self.borrow_book_title_var.trace("w", self.update_book_id)  # Trigger update when text changes
         ttk.Entry(borrow_frame, textvariable=self.borrow_book_title_var, width=30).grid(row=0, column=1, padx=5, pady=5)
+        borrow_suggestions = tk.Listbox(borrow_frame, height=4, width=60)
+        borrow_suggestions.grid(row=0, column=2, rowspan=3, padx=5, pady=5, sticky="n")
+        self.borrow_suggestions = TitleSuggestions(
+            self.root, self.library, borrow_suggestions, self.borrow_book_title_var, self.borrow_book_id_var)
 
         # Member ID field
         ttk.Label(borrow_frame, text="Member ID:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
@@ -401,8 +331,9 @@ class LibraryApp:
         # Book Title field for returning books
         ttk.Label(return_frame, text="Book Title:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
         self.return_book_title_var = tk.StringVar()
-        self.return_book_title_var.trace("w", self.update_return_book_id)  # Trigger update when text changes
         ttk.Entry(return_frame, textvariable=self.return_book_title_var, width=30).grid(row=0, column=1, padx=5, pady=5)
+        return_suggestions = tk.Listbox(return_frame, height=4, width=60)
+        return_suggestions.grid(row=0, column=2, rowspan=4, padx=5, pady=5, sticky="n")
 
         # Book ID Display (Read-only)
         ttk.Label(return_frame, text="Book ID:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
@@ -415,9 +346,18 @@ class LibraryApp:
         self.return_member_id_var = tk.StringVar()
         ttk.Entry(return_frame, textvariable=self.return_member_id_var, width=30).grid(row=2, column=1, padx=5, pady=5)
 
+        # Returns list every copy out on loan, those on loan to the entered member first
+        self.return_suggestions = TitleSuggestions(
+            self.root, self.library, return_suggestions, self.return_book_title_var, self.return_book_id_var,
+            member_var=self.return_member_id_var)
+
         # Return Book button
         ttk.Button(return_frame, text="Return Book", command=self.return_book).grid(row=3, column=0, columnspan=2, pady=10)
 
+        # Book drops and class sets: a CSV of loans and returns processed as one batch
+        ttk.Button(return_frame, text="Process Batch File...", command=self.process_batch_file).grid(
+            row=4, column=0, columnspan=2, pady=(0, 10))
+
         # Available Books Section
         available_books_frame = ttk.Frame(lending_frame)
         available_books_frame.pack(fill="both", expand=True, padx=10, pady=10)
@@ -447,48 +387,160 @@ class LibraryApp:
 
         scrollbar = ttk.Scrollbar(available_books_frame, orient="vertical", command=self.available_books_tree.yview)
         scrollbar.pack(side="right", fill="y")
-        self.available_books_tree.configure(yscrollcommand=scrollbar.set)
+        if self.virtual:
+            self.available_table = VirtualTable(self.available_books_tree, scrollbar, self._available_row)
+        else:
+            self.available_books_tree.configure(yscrollcommand=scrollbar.set)
 
         ttk.Button(lending_frame, text="Show All Available Books", command=self.load_available_books).pack(pady=10)
 
-        self.load_available_books()
+    def _book_row(self, book):
+        status = "Available" if book.available else "Borrowed"
+        return book.book_id, (book.book_id, book.title, book.author, status)
+
+    def _available_row(self, book):
+        return book.book_id, (book.book_id, book.title, book.author)
+
+    def _member_row(self, member):
+        """Row for the Members view, with borrowed books and return dates."""
+        loans = self.library.member_loans(member.member_id)
+        if loans:
+            books_borrowed = ", ".join(
+                f"{book_id}: {title} (Due: {due_date.strftime('%Y-%m-%d') if due_date else 'n/a'})"
+                if title is not None else f"{book_id}: (missing)"
+                for book_id, title, due_date in loans
+            )
+        else:
+            books_borrowed = "None"
+        return member.member_id, (member.member_id, member.name, books_borrowed)
 
-    def load_books(self):
-        for item in self.books_tree.get_children():
-            self.books_tree.delete(item)
+    def _show_rows(self, tree, table, items, row):
+        """Replace a view's rows with `items`: all at once, or windowed in virtual mode."""
+        if table:
+            table.show(lambda: len(items), lambda offset, limit: items[offset:offset + limit])
+            return
+        tree.delete(*tree.get_children())
+        for item in items:
+            iid, values = row(item)
+            tree.insert('', 'end', iid=iid, values=values)
 
-        for book in self.library.list_books():
-            status = "Available" if book.available else "Borrowed"
-            self.books_tree.insert('', 'end', values=(book.book_id, book.title, book.author, status))
+    def load_books(self):
+        self.books_filtered = False
+        if self.books_table:
+            books = self.library.books
+            self.books_table.show(lambda: len(books), books.page)
+        else:
+            self._show_rows(self.books_tree, None, self.library.list_books(), self._book_row)
 
     def load_members(self):
         """Load all members into the Treeview with borrowed books and return dates displayed."""
-        # Clear the Treeview
-        for item in self.members_tree.get_children():
-            self.members_tree.delete(item)
-
-        # Insert members into the Treeview
-        for member_id, member in self.library.members.items():
-            if member.books_borrowed:
-                books_borrowed = ", ".join(
-                    f"{book_id}: {next(book.title for book in self.library.list_books() if book.book_id == book_id)} "
-                    f"(Due: {next(book.due_date.strftime('%Y-%m-%d') for book in self.library.list_books() if book.book_id == book_id)})"
-                    for book_id in member.books_borrowed
-                )
-            else:
-                books_borrowed = "None"
-            self.members_tree.insert('', 'end', values=(member_id, member.name, books_borrowed))
+        self.members_filtered = False
+        members = self.library.members
+        if self.members_table:
+            member_ids = self.member_ids
+            self.members_table.show(
+                lambda: len(member_ids),
+                lambda offset, limit: [members[member_id] for member_id in member_ids[offset:offset + limit]])
+        else:
+            self._show_rows(self.members_tree, None, list(members.values()), self._member_row)
 
     def load_available_books(self):
-        """Load all available books into the Treeview."""
-        # Clear the Treeview
-        for item in self.available_books_tree.get_children():
-            self.available_books_tree.delete(item)
+        """Load all available books into the Treeview, straight from the library's shelf."""
+        self.available_filtered = False
+        if self.available_table:
+            self.available_table.show(self.library.count_available, self.library.available_books)
+        else:
+            self._show_rows(self.available_books_tree, None, self.library.available_books(), self._available_row)
+
+    def on_library_change(self, event, item):
+        """Patch the rows affected by a change (or a batch of changes) reported by the Library."""
+        changes = item if event == "batch" else [(event, item)]
+        # Removed rows go first: new rows are placed by looking up the books already listed
+        changes = sorted(changes, key=lambda change: change[0] != "book_removed")
+        self.listed_keys = {}  # Tree -> sort keys of its rows, fetched once per notification
+        for event, item in changes:
+            if event in ("book_added", "book_changed"):
+                self._patch_book(item, event == "book_added")
+                self._patch_available_book(item)
+            elif event == "book_removed":
+                self._drop_book(item)
+            else:
+                self._patch_member(item, event)
+        self.listed_keys = {}  # The views may be reloaded before the next notification
+
+        # Virtual views re-render their visible rows once, however many changes there were
+        books_changed = any(event.startswith("book_") for event, item in changes)
+        members_changed = any(event.startswith("member_") for event, item in changes)
+        for table, changed in ((self.books_table, books_changed), (self.available_table, books_changed),
+                               (self.members_table, members_changed)):
+            if table and changed:
+                table.refresh()
+
+    def _patch_book(self, book, added):
+        if self.books_table:
+            return
+        if self.books_tree.exists(book.book_id):
+            self.books_tree.item(book.book_id, values=self._book_row(book)[1])
+        elif added and not self.books_filtered:
+            self._insert_in_order(self.books_tree, book, self._book_row)
 
-        # Insert available books into the Treeview
-        for book in self.library.list_books():
-            if book.available:
-                self.available_books_tree.insert('', 'end', values=(book.book_id, book.title, book.author))
+    def _patch_available_book(self, book):
+        if self.available_table:
+            return
+        listed = self.available_books_tree.exists(book.book_id)
+        if book.available and not listed and not self.available_filtered:
+            self._insert_in_order(self.available_books_tree, book, self._available_row)
+        elif not book.available and listed:
+            self._delete_row(self.available_books_tree, book)
+
+    def _insert_in_order(self, tree, book, row):
+        """Insert a row for `book` among the rows already listed, in title order.
+
+        Not at its rank in the library: inside a batch, books changed later in the
+        same batch are already on the shelf but not yet listed.
+        """
+        keys = self._listed(tree)
+        key = BookBST._key(book)
+        index = bisect.bisect_left(keys, key)
+        keys.insert(index, key)
+        iid, values = row(book)
+        tree.insert('', index, iid=iid, values=values)
+
+    def _listed(self, tree):
+        # One Tcl round trip per view and notification, then kept in step locally
+        keys = self.listed_keys.get(tree)
+        if keys is None:
+            book_index = self.library.book_index
+            keys = self.listed_keys[tree] = [BookBST._key(book_index[iid]) for iid in tree.get_children()]
+        return keys
+
+    def _delete_row(self, tree, book):
+        keys = self.listed_keys.get(tree)
+        if keys is not None:
+            del keys[bisect.bisect_left(keys, BookBST._key(book))]
+        tree.delete(book.book_id)
+
+    def _drop_book(self, book):
+        for tree, table in ((self.books_tree, self.books_table), (self.available_books_tree, self.available_table)):
+            if not table and tree.exists(book.book_id):
+                self._delete_row(tree, book)
+
+    def _patch_member(self, member, event):
+        if event == "member_added":
+            self.member_ids.append(member.member_id)
+        elif event == "member_removed":
+            self.member_ids.remove(member.member_id)
+
+        if self.members_table:
+            return
+        if self.members_tree.exists(member.member_id):
+            if event == "member_removed":
+                self.members_tree.delete(member.member_id)
+            else:
+                self.members_tree.item(member.member_id, values=self._member_row(member)[1])
+        elif event == "member_added" and not self.members_filtered:
+            iid, values = self._member_row(member)
+            self.members_tree.insert('', 'end', iid=iid, values=values)
 
     def add_book(self):
         title = self.title_var.get().strip()
@@ -500,13 +552,23 @@ class LibraryApp:
 
         book_id = self.library.add_book(title, author)
         messagebox.showinfo("Success", f"Book added with ID: {book_id}")
-        self.library.save_books_to_csv()  # Save books to CSV
-        self.load_books()  # Refresh the Books Tab
 
         # Clear the text boxes
         self.title_var.set("")
         self.author_var.set("")
 
+    def remove_books(self):
+        """Weed the books selected in the Books view, after asking for confirmation."""
+        book_ids = self.books_tree.selection()  # Rows are keyed by book_id
+        if not book_ids:
+            messagebox.showwarning("Selection Error", "No book selected!")
+            return
+        if not messagebox.askyesno("Remove Books", f"Remove {len(book_ids)} book(s) from the catalog?"):
+            return
+
+        removed = sum(self.library.remove_books(book_ids))
+        messagebox.showinfo("Success", f"{removed} book(s) removed.")
+
     def add_member(self):
         name = self.member_name_var.get().strip()
 
@@ -516,8 +578,6 @@ class LibraryApp:
 
         member_id = self.library.add_member(name)
         messagebox.showinfo("Success", f"Member added with ID: {member_id}")
-        self.library.save_members_to_csv()  # Save members to CSV
-        self.load_members()  # Refresh the Members Tab
 
         # Clear the text box
         self.member_name_var.set("")
@@ -530,16 +590,17 @@ class LibraryApp:
             messagebox.showwarning("Input Error", "Book title and Member ID are required!")
             return
 
+        work = self.library.find_work(book_title)  # The title borrow_book() lends or queues for
+        already_waiting = work is not None and member_id in work.waiting_list
         success, message = self.library.borrow_book(book_title, member_id)
         if success:
             # Retrieve the borrowed book and member details
-            books = self.library.books.search(book_title)
             member = self.library.members.get(member_id)
             if not member:
                 messagebox.showerror("Error", "Member not found!")
                 return
 
-            for book in books:
+            for book in work.copies:
                 if book.borrowed_by == member_id:
                     due_date = book.due_date.strftime('%Y-%m-%d')  # Format the due date
                     # Create a receipt-like message
@@ -553,41 +614,39 @@ class LibraryApp:
                     )
                     messagebox.showinfo("Borrow Successful", receipt)
                     break
+        elif work is None:
+            messagebox.showerror("Error", message)  # No such title, e.g. "Book Not Found"
         else:
             # Handle the case where the book is unavailable
-            books = self.library.books.search(book_title)
-            if books:
-                book = books[0]
-                queue_position = len(book.waiting_list)  # Calculate the queue position
-                member = self.library.members.get(member_id)
-                if not member:
-                    messagebox.showerror("Error", "Member not found!")
-                    return
-
-                # Create a receipt-like message for the waiting list
-                receipt = (
-                    f"--- Waiting List Receipt ---\n"
-                    f"Member Name: {member.name}\n"
-                    f"Member ID: {member_id}\n"
-                    f"Book Title: {book.title}\n"
-                    f"Queue Position: {queue_position}\n"
-                    f"-----------------------------\n"
-                    f"Do you want to cancel your request?"
-                )
-
-                # Create a custom dialog for canceling the request
-                if messagebox.askyesno("Book Unavailable", receipt):
-                    # If the user chooses to cancel, remove them from the waiting list
-                    book.waiting_list.remove(member_id)
-                    messagebox.showinfo("Request Canceled", "Your request to borrow the book has been canceled.")
-                else:
-                    messagebox.showinfo("Request Confirmed", "You have been added to the waiting list.")
-
-        self.library.save_books_to_csv()  # Save books to CSV
-        self.library.save_members_to_csv()  # Save members to CSV
-        self.load_books()  # Refresh the Books Tab
-        self.load_members()  # Refresh the Members Tab
-        self.load_available_books()  # Refresh the Available Books section
+            book = work.copies[0]
+            queue_position = self.library.reservation_position(book.book_id, member_id)
+            member = self.library.members.get(member_id)
+            if not member:
+                messagebox.showerror("Error", "Member not found!")
+                return
+            if already_waiting:
+                # The library refused a second hold; the one already queued stays as it is
+                messagebox.showinfo("Book Unavailable", message)
+                return
+
+            # Create a receipt-like message for the waiting list
+            receipt = (
+                f"--- Waiting List Receipt ---\n"
+                f"Member Name: {member.name}\n"
+                f"Member ID: {member_id}\n"
+                f"Book Title: {book.title}\n"
+                f"Queue Position: {queue_position}\n"
+                f"-----------------------------\n"
+                f"Do you want to cancel your request?"
+            )
+
+            # Create a custom dialog for canceling the request
+            if messagebox.askyesno("Book Unavailable", receipt):
+                # If the user chooses to cancel, remove them from the waiting list
+                self.library.cancel_reservation(book.book_id, member_id)
+                messagebox.showinfo("Request Canceled", "Your request to borrow the book has been canceled.")
+            else:
+                messagebox.showinfo("Request Confirmed", "You have been added to the waiting list.")
 
         # Clear the text boxes
         self.borrow_book_title_var.set("")
@@ -607,17 +666,54 @@ class LibraryApp:
         else:
             messagebox.showerror("Error", message)
 
-        self.library.save_books_to_csv()  # Save books to CSV
-        self.library.save_members_to_csv()  # Save members to CSV
-        self.load_books()  # Refresh the Books Tab
-        self.load_members()  # Refresh the Members Tab
-        self.load_available_books()  # Refresh the Available Books section
-
         # Clear the text boxes
         self.return_book_id_var.set("")
         self.return_book_title_var.set("")
         self.return_member_id_var.set("")
 
+    def process_batch_file(self):
+        """Run a CSV of loans, returns and removals (columns action, book, member_id) and summarize the outcome."""
+        filename = filedialog.askopenfilename(
+            title="Process Batch File", filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not filename:
+            return
+        try:
+            results = self.library.process_batch_file(filename)
+        except (OSError, KeyError, ValueError) as error:
+            messagebox.showerror("Batch Failed", f"The batch file could not be processed:\n{error}")
+            return
+
+        # Row numbers as seen in a spreadsheet, after the header row
+        failures = [f"Row {number}: {message}"
+                    for number, (success, message) in enumerate(results, start=2) if not success]
+        summary = f"{len(results) - len(failures)} of {len(results)} rows processed successfully."
+        if failures:
+            summary += "\n\n" + "\n".join(failures[:10])
+            if len(failures) > 10:
+                summary += f"\n...and {len(failures) - 10} more."
+        messagebox.showinfo("Batch Complete", summary)
+
+    def on_close(self):
+        """Fold the journal into the CSV files and wait for the writes before the window closes."""
+        self.library.close()
+        self.root.destroy()
+
+    def report_storage_errors(self):
+        """Show errors from the background writer. Polled so that dialogs are opened on the Tk thread."""
+        errors = getattr(self.storage, "errors", None)
+        while errors is not None and not errors.empty():
+            messagebox.showerror("Save Failed", f"Library data could not be written to disk:\n{errors.get()}")
+        self.root.after(500, self.report_storage_errors)
+
+    def _note_input(self, event=None):
+        self.last_input = time.monotonic()
+
+    def compact_when_idle(self, idle_seconds=30, changes=200):
+        """Compact once `changes` have piled up and nobody has touched the window for `idle_seconds`."""
+        if self.library.changes >= changes and time.monotonic() - self.last_input >= idle_seconds:
+            self.library.compact()
+        self.root.after(5000, self.compact_when_idle)
+
     def show_most_borrowed_books(self):
         """Display the top 3 most borrowed books."""
         most_borrowed_books = self.library.get_most_borrowed_books(top_n=3)  # Limit to top 3 books
@@ -632,30 +728,21 @@ class LibraryApp:
 
         messagebox.showinfo("Most Borrowed Books", message)
 
-    def load_status(self):
-        """Load the status of all books into the Treeview."""
-        # Clear the Treeview
-        for item in self.status_tree.get_children():
-            self.status_tree.delete(item)
-
-        # Insert books into the Treeview
-        for book in self.library.list_books():
-            status = "Available" if book.available else "Borrowed"
-            self.status_tree.insert('', 'end', values=(book.book_id, book.title, book.author, status))
-
-    def update_book_id(self, *args):
-        """Update the Book ID field based on the entered book title."""
-        book_title = self.borrow_book_title_var.get().strip()
-        if not book_title:
-            self.borrow_book_id_var.set("")  # Clear the Book ID field if no title is entered
+    def show_overdue_books(self, limit=20):
+        """Display the books whose due date has passed, earliest first."""
+        count = self.library.count_overdue()
+        if not count:
+            messagebox.showinfo("Overdue Books", "No books are overdue.")
             return
 
-        # Search for the book by title
-        books = self.library.books.search(book_title)
-        if books:
-            self.borrow_book_id_var.set(books[0].book_id)  # Display the first matching book's ID
-        else:
-            self.borrow_book_id_var.set("Not Found")  # Display "Not Found" if no match
+        message = f"{count} overdue book(s):\n"
+        for book in self.library.overdue_books(limit=limit):
+            member = self.library.members.get(book.borrowed_by)
+            name = member.name if member else "(removed member)"
+            message += f"- {book.title} ({book.book_id}), {name} ({book.borrowed_by}), due {book.due_date.strftime('%Y-%m-%d')}\n"
+        if count > limit:
+            message += f"...and {count - limit} more."
+        messagebox.showinfo("Overdue Books", message)
 
     def update_book_title(self, *args):
         """Update the Book Title field based on the entered book ID."""
@@ -664,27 +751,12 @@ class LibraryApp:
             self.return_book_title_var.set("")  # Clear the Book Title field if no ID is entered
             return
 
-        # Search for the book by ID
-        for book in self.library.list_books():
-            if book.book_id == book_id:
-                self.return_book_title_var.set(book.title)  # Display the matching book's title
-                return
-
-        self.return_book_title_var.set("Not Found")  # Display "Not Found" if no match
-
-    def update_return_book_id(self, *args):
-        """Update the Book ID field based on the entered book title in the Return Section."""
-        book_title = self.return_book_title_var.get().strip()
-        if not book_title:
-            self.return_book_id_var.set("")  # Clear the Book ID field if no title is entered
-            return
-
-        # Search for the book by title
-        books = self.library.books.search(book_title)
-        if books:
-            self.return_book_id_var.set(books[0].book_id)  # Display the first matching book's ID
+        # Look up the book by ID
+        book = self.library.get_book(book_id)
+        if book:
+            self.return_book_title_var.set(book.title)  # Display the matching book's title
         else:
-            self.return_book_id_var.set("Not Found")  # Display "Not Found" if no match
+            self.return_book_title_var.set("Not Found")  # Display "Not Found" if no match
 
     def search_members(self):
         """Search for members by name or ID and display the results."""
@@ -693,22 +765,14 @@ class LibraryApp:
             self.load_members()  # If the search bar is empty, reload all members
             return
 
-        # Clear the Treeview
-        for item in self.members_tree.get_children():
-            self.members_tree.delete(item)
-
-        # Search for members by name or ID
-        for member_id, member in self.library.members.items():
-            if query in member_id.lower() or query in member.name.lower():
-                if member.books_borrowed:
-                    books_borrowed = ", ".join(
-                        f"{book_id}: {next(book.title for book in self.library.list_books() if book.book_id == book_id)}"
-                        f"(Due: {next(book.due_date.strftime('%Y-%m-%d') for book in self.library.list_books() if book.book_id == book_id)})"
-                        for book_id in member.books_borrowed
-                    )
-                else:
-                    books_borrowed = "None"
-                self.members_tree.insert('', 'end', values=(member_id, member.name, books_borrowed))
+        # Search the member directory by ID and name; virtual views only build the rows in sight
+        self.members_filtered = True
+        library = self.library
+        if self.members_table:
+            self.members_table.show(lambda: library.count_members(query),
+                                    lambda offset, limit: library.search_members(query, offset, limit))
+        else:
+            self._show_rows(self.members_tree, None, library.search_members(query), self._member_row)
 
         # Clear the search bar
         self.search_member_var.set("")
@@ -720,15 +784,10 @@ class LibraryApp:
             self.load_books()  # If the search bar is empty, reload all books
             return
 
-        # Clear the Treeview
-        for item in self.books_tree.get_children():
-            self.books_tree.delete(item)
-
-        # Search for books by title or author
-        for book in self.library.list_books():
-            if query in book.title.lower() or query in book.author.lower():
-                status = "Available" if book.available else "Borrowed"
-                self.books_tree.insert('', 'end', values=(book.book_id, book.title, book.author, status))
+        # Search for books with every word in the title or author, best matches first
+        matches = self.library.find_books(query, include_author=True)
+        self.books_filtered = True
+        self._show_rows(self.books_tree, self.books_table, matches, self._book_row)
 
         # Clear the search bar
         self.search_book_var.set("")
@@ -740,47 +799,11 @@ class LibraryApp:
             return
 
         member_id = self.members_tree.item(selected_item, "values")[0]
-        if member_id in self.library.members:
-            del self.library.members[member_id]
-            self.library.save_members_to_csv()  # Save updated members to CSV
-            self.load_members()  # Refresh the Members Tab
+        if self.library.remove_member(member_id):
             messagebox.showinfo("Success", f"Member with ID {member_id} deleted successfully!")
         else:
             messagebox.showerror("Error", "Member not found!")
 
-    def _remove_book(self, node, book_id):
-        """Helper method to remove a book from the BST."""
-        if not node:
-            return None
-
-        # Compare book_id as strings (since book_id is stored as a string)
-        if book_id < node.book.book_id:
-            node.left = self._remove_book(node.left, book_id)
-        elif book_id > node.book.book_id:
-            node.right = self._remove_book(node.right, book_id)
-        else:
-            # Node to be deleted found
-            if not node.left:
-                return node.right
-            if not node.right:
-                return node.left
-            # Node with two children: Get the inorder successor (smallest in the right subtree)
-            min_larger_node = self._get_min(node.right)
-            node.book = min_larger_node.book
-            node.right = self._remove_book(node.right, min_larger_node.book.book_id)
-        return node
-
-    def _get_min(self, node):
-        """Helper method to find the minimum node in a BST."""
-        while node.left:
-            node = node.left
-        return node
-
-    def print_books(self):
-        books = self.library.books.in_order()
-        for book in books:
-            print(f"Book ID: {book.book_id}, Title: {book.title}")
-
     def search_lending_books(self):
         """Search for books by title or author in the Lending Page and display the results."""
         query = self.search_lending_book_var.get().strip().lower()
@@ -788,36 +811,38 @@ class LibraryApp:
             self.load_available_books()  # If the search bar is empty, reload all available books
             return
 
-        # Clear the Treeview
-        for item in self.available_books_tree.get_children():
-            self.available_books_tree.delete(item)
-
-        # Search for books by title or author
-        for book in self.library.list_books():
-            if book.available and (query in book.title.lower() or query in book.author.lower()):
-                self.available_books_tree.insert('', 'end', values=(book.book_id, book.title, book.author))
+        # Search for books with every word in the title or author, best matches first
+        matches = self.library.find_books(query, include_author=True, available_only=True)
+        self.available_filtered = True
+        self._show_rows(self.available_books_tree, self.available_table, matches, self._available_row)
 
         # Clear the search bar
         self.search_lending_book_var.set("")
 
-root = tk.Tk()
-app = LibraryApp(root)
-root.mainloop()
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+def main():
+    # LIBRARY_METRICS=<file> dumps metrics there every minute (Prometheus text for .prom, else JSON);
+    # LIBRARY_PROFILE=<file> saves a cProfile capture of the session there on exit;
+    # LIBRARY_SNAPSHOT=<file> keeps the catalog in a binary snapshot there instead of CSV
+    metrics_file = os.environ.get("LIBRARY_METRICS")
+    profile_file = os.environ.get("LIBRARY_PROFILE")
+    metrics = Metrics() if metrics_file or profile_file else None
+    if profile_file:
+        metrics.start_profile()
+
+    snapshot_file = os.environ.get("LIBRARY_SNAPSHOT")
+    storage = PersistenceWorker(SnapshotStorage(snapshot_file)) if snapshot_file else None
+
+    root = tk.Tk()
+    app = LibraryApp(root, storage=storage, metrics=metrics)
+    if metrics_file:
+        metrics.dump_every(metrics_file)
+    root.mainloop()
+
+    if metrics_file:
+        metrics.stop_dumping()
+        metrics.dump(metrics_file)
+    if profile_file:
+        metrics.stop_profile(profile_file)
+
+if __name__ == "__main__":
+    main()
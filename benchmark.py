@@ -0,0 +1,213 @@
+"""Benchmarks for the Library hot paths on synthetic catalogs.
+
+    python benchmark.py --sizes 1000,100000 --order sorted,shuffled --output results.json
+    python benchmark.py --sizes 100000 --compare results.json
+
+Workloads are generated from --seed, so two runs with the same arguments time the
+same operations on the same data and can be compared with --compare.
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+from library_core import Library
+
+def generate_catalog(size, seed=0, skew=1.1, order="shuffled"):
+    """Return `size` (title, author) pairs.
+
+    Titles and authors are drawn from Zipf-like distributions (weight 1 / rank ** skew),
+    so popular titles have many copies and popular authors many books, as in a real
+    collection. `order` is "sorted" (by title) or "shuffled".
+    """
+    rng = random.Random(seed)
+    words = ["".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 9)))
+             for _ in range(5000)]
+    titles = [" ".join(rng.choice(words) for _ in range(rng.randint(1, 5))).title()
+              for _ in range(max(1, size // 2))]
+    authors = [f"{rng.choice(words).title()} {rng.choice(words).title()}" for _ in range(max(1, size // 20))]
+    catalog = list(zip(_zipf_choices(rng, titles, size, skew), _zipf_choices(rng, authors, size, skew)))
+    if order == "sorted":
+        catalog.sort()
+    return catalog
+
+def generate_members(size, seed=0):
+    """Return `size` member names."""
+    rng = random.Random(seed)
+    return [f"Member {rng.randrange(10 ** 9)}" for _ in range(size)]
+
+def _zipf_choices(rng, population, k, skew):
+    weights = itertools.accumulate(1 / rank ** skew for rank in range(1, len(population) + 1))
+    return rng.choices(population, cum_weights=list(weights), k=k)
+
+def _time_each(func, args):
+    """Call func(*a) for every a in `args` and return the latencies in nanoseconds."""
+    clock = time.perf_counter_ns
+    latencies = []
+    for a in args:
+        start = clock()
+        func(*a)
+        latencies.append(clock() - start)
+    return latencies
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _summary(latencies):
+    """Throughput and latency percentiles (microseconds) for one case."""
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    return {
+        "ops": len(ordered),
+        "seconds": total / 1e9,
+        "ops_per_s": len(ordered) / (total / 1e9) if total else None,
+        "p50_us": _percentile(ordered, 0.50) / 1e3,
+        "p90_us": _percentile(ordered, 0.90) / 1e3,
+        "p99_us": _percentile(ordered, 0.99) / 1e3,
+        "max_us": ordered[-1] / 1e3,
+    }
+
+def _bulk(seconds, rows):
+    """Throughput for a one-shot operation over `rows` rows."""
+    return {"ops": rows, "seconds": seconds, "ops_per_s": rows / seconds if seconds else None}
+
+def _member_row():
+    """Return the Members view row formatter, or None when the GUI module cannot be imported."""
+    try:
+        from Library import LibraryApp
+    except ImportError:  # No tkinter on this machine
+        return None
+    return LibraryApp._member_row
+
+def run(size, order="shuffled", members=None, seed=0, skew=1.1, samples=1000, memory=True):
+    """Time every case on a catalog of `size` books and return {case: summary}."""
+    catalog = generate_catalog(size, seed, skew, order)
+    rng = random.Random(seed + 1)
+    # O(n) operations get fewer repetitions on large catalogs so a run stays bounded
+    scans = max(3, min(samples, 2_000_000 // size))
+    results = {}
+
+    library = Library()
+    member_ids = [library.add_member(name) for name in generate_members(members or max(10, size // 20), seed)]
+    results["add_book"] = _summary(_time_each(library.add_book, catalog))
+
+    queries = [(title[:4],) for title, _ in rng.choices(catalog, k=scans)]
+    results["search_books"] = _summary(_time_each(library.search_books, queries))
+    results["bst_search"] = _summary(_time_each(library.books.search, queries))
+
+    borrows = [(title, rng.choice(member_ids)) for title, _ in rng.choices(catalog, k=samples)]
+    results["borrow_book"] = _summary(_time_each(library.borrow_book, borrows))
+    loans = [(book.book_id, member_id) for member_id in member_ids for book in library.get_loans(member_id)]
+    rng.shuffle(loans)
+    results["return_book"] = _summary(_time_each(library.return_book, loans))
+
+    results["list_books"] = _summary(_time_each(library.list_books, [()] * scans))
+    results["get_most_borrowed_books"] = _summary(
+        _time_each(library.get_most_borrowed_books, [(10,)] * samples))
+
+    member_row = _member_row()
+    if member_row is not None:
+        view = types.SimpleNamespace(library=library)
+        results["member_view_row"] = _summary(
+            _time_each(member_row, [(view, member) for member in library.members.values()]))
+
+    with tempfile.TemporaryDirectory() as directory:
+        books_file = os.path.join(directory, "books.csv")
+        start = time.perf_counter()
+        library.save_books_to_csv(books_file)
+        results["save_books_csv"] = _bulk(time.perf_counter() - start, size)
+
+        start = time.perf_counter()
+        Library().load_books_from_csv(books_file)
+        results["load_books_csv"] = _bulk(time.perf_counter() - start, size)
+
+        if memory:
+            # Separate pass, as tracemalloc slows down the code it traces
+            tracemalloc.start()
+            loaded = Library()
+            loaded.load_books_from_csv(books_file)
+            results["load_books_csv"]["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del loaded
+    return results
+
+def compare(results, baseline, tolerance):
+    """Print each case's time against `baseline` and return the cases slower by more than `tolerance`."""
+    previous = {(run["size"], run["order"], case): summary
+                for run in baseline["runs"] for case, summary in run["results"].items()}
+    regressions = []
+    for run_result in results["runs"]:
+        for case, summary in run_result["results"].items():
+            old = previous.get((run_result["size"], run_result["order"], case))
+            if old is None:
+                continue
+            metric = "p50_us" if "p50_us" in summary else "seconds"
+            ratio = summary[metric] / old[metric] if old[metric] else 1.0
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = "  REGRESSION"
+                regressions.append((run_result["size"], run_result["order"], case))
+            print(f"{run_result['size']:>9} {run_result['order']:<9} {case:<24} {metric:<8} "
+                  f"{old[metric]:>12.3f} -> {summary[metric]:>12.3f}  x{ratio:.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated catalog sizes")
+    parser.add_argument("--order", default="shuffled", help="sorted, shuffled, or both comma-separated")
+    parser.add_argument("--members", type=int, help="members per run (default: size / 20)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for titles and authors")
+    parser.add_argument("--samples", type=int, default=1000, help="operations timed per case")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a case fails --compare")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "started": datetime.datetime.now().isoformat(timespec="seconds"),
+            "seed": args.seed,
+            "skew": args.skew,
+            "samples": args.samples,
+        },
+        "runs": [],
+    }
+    for size in (int(size) for size in args.sizes.split(",")):
+        for order in args.order.split(","):
+            print(f"benchmarking {size} books, {order} order...", file=sys.stderr)
+            results["runs"].append({
+                "size": size,
+                "order": order,
+                "results": run(size, order, args.members, args.seed, args.skew, args.samples, not args.no_memory),
+            })
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(text + "\n")
+    elif not args.compare:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,10 @@
+"""Headless library domain model: catalog, members, lending and storage, with no GUI dependencies."""
+
+from .autocomplete import PrefixIndex, TitleCompleter
+from .catalog import BookBST, BookNode
+from .indexes import Leaderboard, TrigramIndex
+from .library import Library
+from .metrics import Metrics
+from .models import Book, Member, Work
+from .reservations import WaitingList
+from .storage import CSVStorage, Journal, PersistenceWorker, SnapshotStorage, SQLiteStorage
@@ -0,0 +1,167 @@
+import bisect
+import itertools
+
+def merge_sorted(keys, items, pending):
+    """Merge unsorted (key, item) pairs into the parallel lists `keys` and `items`, sorted by key.
+
+    Returns the merged (keys, items): the same lists, or new ones after a bulk merge.
+    Pending pairs go after existing ones with an equal key.
+    """
+    if len(pending) < 64:
+        # A few interactive adds: insert in place (a memmove per add)
+        for key, item in pending:
+            index = bisect.bisect_right(keys, key)
+            keys.insert(index, key)
+            items.insert(index, item)
+        return keys, items
+    # Bulk load: one stable sort over everything
+    pairs = list(zip(keys, items))
+    pairs.extend(pending)
+    pairs.sort(key=lambda pair: pair[0])
+    return [key for key, item in pairs], [item for key, item in pairs]
+
+class PrefixIndex:
+    """Sorted array of lowercase texts, for prefix lookups by binary search."""
+
+    def __init__(self):
+        self.keys = []      # Normalized texts, sorted
+        self.items = []     # Item for each key
+        self.pending = []   # (key, item) pairs added since the last lookup
+        self.removed = []   # (key, item) pairs removed since the last lookup
+        self.presorted = None  # (items, text) from add_sorted(), until the first lookup
+        self.version = 0    # Bumped on every change; positions from older versions are stale
+
+    def add(self, item, text):
+        self.pending.append((text.lower(), item))
+        self.version += 1
+
+    def add_sorted(self, items, text):
+        """Load an empty index with `items` already sorted by lowercase text(item).
+
+        Their keys are only computed by the first lookup, which then needs no sort.
+        """
+        self.presorted = (items, text)
+        self.version += 1
+
+    def remove(self, item, text):
+        """Remove an item that was added with `text`. Applied by the next lookup, like add()."""
+        self.removed.append((text.lower(), item))
+        self.version += 1
+
+    def _merge(self):
+        if self.presorted is not None:
+            items, text = self.presorted
+            self.presorted = None
+            self.keys = [text(item).lower() for item in items]
+            self.items = list(items)
+        if self.pending:
+            self.keys, self.items = merge_sorted(self.keys, self.items, self.pending)
+            self.pending = []
+        if self.removed:
+            self._drop_removed()
+
+    def _drop_removed(self):
+        if len(self.removed) < 64:
+            # A few interactive removals: delete in place (a memmove per removal)
+            for key, item in self.removed:
+                index = bisect.bisect_left(self.keys, key)
+                while index < len(self.keys) and self.keys[index] == key:
+                    if self.items[index] is item:
+                        del self.keys[index]
+                        del self.items[index]
+                        break
+                    index += 1
+        else:
+            # Weeding: one pass over everything, with a mask rather than a tuple per
+            # entry (a million new tuples would set off the cyclic collector)
+            gone = {id(item) for key, item in self.removed}
+            keep = [id(item) not in gone for item in self.items]
+            self.keys = list(itertools.compress(self.keys, keep))
+            self.items = list(itertools.compress(self.items, keep))
+        self.removed = []
+
+    def range(self, prefix, within=None):
+        """Return the (lo, hi) positions of the keys starting with `prefix`.
+
+        `within` narrows the binary search to an earlier range, e.g. the one found
+        for a shorter prefix of the same text.
+        """
+        self._merge()
+        lo, hi = within or (0, len(self.keys))
+        lo = bisect.bisect_left(self.keys, prefix, lo, hi)
+        hi = bisect.bisect_left(self.keys, prefix + "\U0010ffff", lo, hi)
+        return lo, hi
+
+    def between(self, lo, hi):
+        """Return the (lo, hi) positions of the keys from `lo` through `hi`."""
+        self._merge()
+        start = bisect.bisect_left(self.keys, lo)
+        return start, bisect.bisect_right(self.keys, hi, start)
+
+class TitleCompleter:
+    """Title suggestions for one input field.
+
+    While the user keeps extending the same prefix, each lookup only searches the
+    range found for the previous one. suggest() groups candidates by title (one copy
+    per title) and ranks them: exact match first, then titles with a copy in the
+    wanted state, then the most borrowed. suggest_loans() lists copies on loan.
+    """
+
+    scan_limit = 500  # Candidates looked at per lookup, so short prefixes stay cheap
+
+    def __init__(self, library):
+        self.library = library
+        self.index = library.title_prefix
+        self.prefix = None
+        self.range = None
+        self.version = None
+
+    def suggest(self, text, limit=10, available_first=True):
+        prefix = text.strip().lower()
+        if not prefix:
+            return []
+        candidates = self._candidates(text, prefix)
+
+        best = {}  # Normalized title -> best copy of it
+        for book in candidates:
+            title = book.title.lower()
+            current = best.get(title)
+            if current is None or (book.available == available_first and current.available != available_first):
+                best[title] = book
+        ranked = sorted(best.values(), key=lambda book: (
+            book.title.lower() != prefix,
+            book.available != available_first,
+            -book.borrow_count,
+            book.title,
+        ))
+        return ranked[:limit]
+
+    def suggest_loans(self, text, member_id=None, limit=10):
+        """Copies on loan matching `text`, one entry per copy rather than per title.
+
+        The copies on loan to `member_id` come first, so that the right copy of a
+        title with many copies can be returned.
+        """
+        prefix = text.strip().lower()
+        if not prefix:
+            return []
+        mine = sorted((book for book in self.library.loans.get(member_id, ()) if prefix in book.title.lower()),
+                      key=lambda book: (book.title.lower() != prefix, book.title.lower(),
+                                      len(book.book_id), book.book_id))
+        others = [book for book in self._candidates(text, prefix)
+                  if not book.available and book.borrowed_by != member_id]
+        others.sort(key=lambda book: book.title.lower() != prefix)  # Stable, so the rest stay in title order
+        return (mine + others)[:limit]
+
+    def _candidates(self, text, prefix):
+        within = None
+        if self.prefix is not None and prefix.startswith(self.prefix) and self.version == self.index.version:
+            within = self.range
+        lo, hi = self.index.range(prefix, within)
+        self.prefix, self.range, self.version = prefix, (lo, hi), self.index.version
+
+        candidates = self.index.items[lo:min(hi, lo + self.scan_limit)]
+        if not candidates:
+            # Nothing starts with it: fall back to substring matches, as the old search did
+            candidates = self.library.search_books(text.strip())[:self.scan_limit]
+        return candidates
@@ -0,0 +1,224 @@
+class BookNode:
+    __slots__ = ("book", "left", "right", "height", "count")
+
+    def __init__(self, book):
+        self.book = book
+        self.left = None
+        self.right = None
+        self.height = 1
+        self.count = 1  # Books in this subtree, for rank/position queries
+
+def _node_height(node):
+    return node.height if node else 0
+
+def _node_count(node):
+    return node.count if node else 0
+
+def _update(node):
+    node.height = 1 + max(_node_height(node.left), _node_height(node.right))
+    node.count = 1 + _node_count(node.left) + _node_count(node.right)
+
+class BookBST:
+    """Title-ordered catalog index, kept height-balanced (AVL) so every operation is O(log n)."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _key(book):
+        # Order by title; copies with the same title are ordered by numeric book_id
+        return (book.title, len(book.book_id), book.book_id)
+
+    def insert(self, book):
+        key = self._key(book)
+        self.size += 1
+        if not self.root:
+            self.root = BookNode(book)
+            return
+
+        path = []
+        node = self.root
+        while node:
+            path.append(node)
+            node = node.left if key < self._key(node.book) else node.right
+
+        parent = path[-1]
+        if key < self._key(parent.book):
+            parent.left = BookNode(book)
+        else:
+            parent.right = BookNode(book)
+        self._rebalance_path(path)
+
+    def build_from_sorted(self, books):
+        """Replace the tree with a balanced one built from books already in key order, in O(n)."""
+        self.root = self._build(books, 0, len(books))
+        self.size = len(books)
+
+    def _build(self, books, lo, hi):
+        # Recursion depth is only log2(n), unlike the old per-insert recursion
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        node = BookNode(books[mid])
+        node.left = self._build(books, lo, mid)
+        node.right = self._build(books, mid + 1, hi)
+        # Halving keeps the tree perfectly balanced, so its size alone gives the height
+        node.count = hi - lo
+        node.height = node.count.bit_length()
+        return node
+
+    def remove(self, book):
+        """Remove a book from the tree. Returns False if it was not found."""
+        key = self._key(book)
+        path = []
+        node = self.root
+        while node:
+            node_key = self._key(node.book)
+            if key == node_key:
+                break
+            path.append(node)
+            node = node.left if key < node_key else node.right
+        if not node:
+            return False
+
+        if node.left and node.right:
+            # Two children: move the in-order successor's book up and unlink the successor instead
+            path.append(node)
+            successor = node.right
+            while successor.left:
+                path.append(successor)
+                successor = successor.left
+            node.book = successor.book
+            node = successor
+
+        child = node.left or node.right
+        if not path:
+            self.root = child
+        elif path[-1].left is node:
+            path[-1].left = child
+        else:
+            path[-1].right = child
+        self._rebalance_path(path)
+        self.size -= 1
+        return True
+
+    def _rebalance_path(self, path):
+        """Restore heights, counts and AVL balance from the bottom of an insert/remove path up to the root."""
+        for i in range(len(path) - 1, -1, -1):
+            node = path[i]
+            subtree = self._rebalance(node)
+            if subtree is not node:
+                if i == 0:
+                    self.root = subtree
+                elif path[i - 1].left is node:
+                    path[i - 1].left = subtree
+                else:
+                    path[i - 1].right = subtree
+
+    def _rebalance(self, node):
+        left_height = _node_height(node.left)
+        right_height = _node_height(node.right)
+        if left_height - right_height > 1:
+            if _node_height(node.left.left) < _node_height(node.left.right):
+                node.left = self._rotate_left(node.left)
+            return self._rotate_right(node)
+        if right_height - left_height > 1:
+            if _node_height(node.right.right) < _node_height(node.right.left):
+                node.right = self._rotate_right(node.right)
+            return self._rotate_left(node)
+        _update(node)
+        return node
+
+    def _rotate_left(self, node):
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        _update(node)
+        _update(pivot)
+        return pivot
+
+    def _rotate_right(self, node):
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        _update(node)
+        _update(pivot)
+        return pivot
+
+    def find(self, title):
+        """Return all copies whose title is exactly `title`, in O(log n + k)."""
+        books = []
+        for book in self._walk_from((title,)):
+            if book.title != title:
+                break
+            books.append(book)
+        return books
+
+    def search(self, title):
+        """Return books whose title contains `title` (case-insensitive), in title order."""
+        title = title.lower()
+        return [book for book in self._walk_from(None) if title in book.title.lower()]
+
+    def in_order(self):
+        return list(self._walk_from(None))
+
+    def rank(self, book):
+        """Return the number of books ordered before `book`, i.e. its position in in_order()."""
+        key = self._key(book)
+        rank = 0
+        node = self.root
+        while node:
+            if key <= self._key(node.book):
+                node = node.left
+            else:
+                rank += _node_count(node.left) + 1
+                node = node.right
+        return rank
+
+    def page(self, offset, limit):
+        """Return up to `limit` books in title order starting at position `offset`, in O(log n + limit)."""
+        stack = []
+        node = self.root
+        while node:
+            left_count = _node_count(node.left)
+            if offset < left_count:
+                stack.append(node)
+                node = node.left
+            elif offset == left_count:
+                stack.append(node)
+                break
+            else:
+                offset -= left_count + 1
+                node = node.right
+
+        books = []
+        while stack and len(books) < limit:
+            node = stack.pop()
+            books.append(node.book)
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+        return books
+
+    def _walk_from(self, key):
+        """Iterate books in title order, starting at the first book whose key is >= `key`."""
+        stack = []
+        node = self.root
+        while node:
+            if key is None or key <= self._key(node.book):
+                stack.append(node)
+                node = node.left
+            else:
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.book
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
@@ -0,0 +1,403 @@
+import bisect
+import operator
+
+from .autocomplete import PrefixIndex, merge_sorted
+
+def match_score(terms, title, author, include_author=False):
+    """Score a book for a multi-term query: 2 per term found in its (lowercase) title, 1 per term
+    found only in its author. Returns 0 unless every term is found."""
+    score = 0
+    for term in terms:
+        if term in title:
+            score += 2
+        elif include_author and term in author:
+            score += 1
+        else:
+            return 0
+    return score
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TrigramIndex:
+    """Inverted index from lowercase trigrams to items, for case-insensitive substring queries.
+
+    Postings are kept per distinct text, so many copies (or many books by one author)
+    share one entry; a text with a single item stores the item itself rather than a
+    one-element set. New texts are only broken into trigrams when the next query or
+    removal needs them, which keeps bulk loads cheap.
+    """
+
+    def __init__(self):
+        self.postings = {}  # trigram -> set of normalized texts
+        self.items = {}     # normalized text -> item, or set of items once there are several
+        self.short = set()  # texts too short to have any trigram
+        self.pending = []   # texts added since the postings were last brought up to date
+        self.bulk = []      # (items, texts) from add_many() not yet added
+        self.scanned = 0    # Candidate texts checked by searches so far, for metrics
+
+    def add(self, item, text):
+        text = text.lower()
+        items = self.items.get(text)
+        if items is None:
+            self.items[text] = item
+            self.pending.append(text)
+        elif type(items) is set:
+            items.add(item)
+        else:
+            self.items[text] = {items, item}
+
+    def add_many(self, items, texts):
+        """add() for many items at once, e.g. a freshly loaded catalog. The work waits for the next lookup."""
+        self.bulk.append((items, texts))
+
+    def _add_bulk(self):
+        index = self.items
+        pending = self.pending
+        for items, texts in self.bulk:
+            for item, text in zip(items, texts):
+                text = text.lower()
+                existing = index.get(text)
+                if existing is None:
+                    index[text] = item
+                    pending.append(text)
+                elif type(existing) is set:
+                    existing.add(item)
+                else:
+                    index[text] = {existing, item}
+        self.bulk = []
+
+    def remove(self, item, text):
+        """Remove an item that was added with `text`."""
+        if self.bulk:
+            self._add_bulk()
+        text = text.lower()
+        items = self.items.get(text)
+        if type(items) is set:
+            items.discard(item)
+            if items:
+                return
+        elif items is not item:
+            return
+        del self.items[text]
+        self._flush()
+        self.short.discard(text)
+        for gram in _trigrams(text):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(text)
+                if not posting:
+                    del self.postings[gram]
+
+    def _flush(self):
+        if self.bulk:
+            self._add_bulk()
+        postings = self.postings
+        for text in self.pending:
+            if text not in self.items:
+                continue  # Removed again before it was indexed
+            grams = _trigrams(text)
+            if not grams:
+                self.short.add(text)
+            for gram in grams:
+                posting = postings.get(gram)
+                if posting is None:
+                    postings[gram] = {text}
+                else:
+                    posting.add(text)
+        self.pending = []
+
+    def search(self, query):
+        """Return the set of items whose text contains `query`."""
+        query = query.lower()
+        if not query:
+            return set()
+        if self.pending or self.bulk:
+            self._flush()
+
+        grams = _trigrams(query)
+        if grams:
+            # Intersect posting lists smallest-first, then drop trigram false positives
+            postings = []
+            for gram in grams:
+                posting = self.postings.get(gram)
+                if not posting:
+                    return set()
+                postings.append(posting)
+            postings.sort(key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            # Queries shorter than a trigram: union the postings of every trigram containing it
+            candidates = set(self.short)
+            for gram, posting in self.postings.items():
+                if query in gram:
+                    candidates |= posting
+
+        self.scanned += len(candidates)
+        matches = set()
+        for text in candidates:
+            if query in text:
+                items = self.items[text]
+                if type(items) is set:
+                    matches |= items
+                else:
+                    matches.add(items)
+        return matches
+
+class Leaderboard:
+    """Items bucketed by a non-negative count that changes in small steps (e.g. borrow_count).
+
+    top() and at_least() walk the buckets from the highest count down, so they cost
+    O(results + log n) with no sort. rank() uses a Fenwick tree over count values.
+    """
+
+    def __init__(self):
+        self.buckets = {}  # count -> dict used as an insertion-ordered set of items
+        self.counts = []   # distinct counts in use, ascending
+        self.fenwick = [0] * 65  # Fenwick tree of bucket sizes, indexed by count + 1
+        self.total = 0
+
+    def __len__(self):
+        return self.total
+
+    def add(self, item, count):
+        self._bump(count, 1)  # Before the bucket changes, as growing the tree rebuilds it from the buckets
+        bucket = self.buckets.get(count)
+        if bucket is None:
+            bucket = self.buckets[count] = {}
+            bisect.insort(self.counts, count)
+        bucket[item] = None
+        self.total += 1
+
+    def add_many(self, items, counts):
+        """add() for many items at once; the Fenwick tree is rebuilt once at the end."""
+        buckets = self.buckets
+        for item, count in zip(items, counts):
+            bucket = buckets.get(count)
+            if bucket is None:
+                bucket = buckets[count] = {}
+            bucket[item] = None
+            self.total += 1
+        self.counts = sorted(buckets)
+        self.fenwick = [0]
+        if self.counts:
+            self._grow(self.counts[-1])
+
+    def remove(self, item, count):
+        bucket = self.buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self.buckets[count]
+            del self.counts[bisect.bisect_left(self.counts, count)]
+        self._bump(count, -1)
+        self.total -= 1
+
+    def update(self, item, old_count, new_count):
+        if old_count != new_count:
+            self.remove(item, old_count)
+            self.add(item, new_count)
+
+    def top(self, n):
+        """Return up to `n` items, highest count first."""
+        items = []
+        for index in range(len(self.counts) - 1, -1, -1):
+            for item in self.buckets[self.counts[index]]:
+                if len(items) == n:
+                    return items
+                items.append(item)
+        return items
+
+    def at_least(self, count):
+        """Return every item whose count is >= `count`, highest first."""
+        items = []
+        start = bisect.bisect_left(self.counts, count)
+        for index in range(len(self.counts) - 1, start - 1, -1):
+            items.extend(self.buckets[self.counts[index]])
+        return items
+
+    def rank(self, count):
+        """Return the 1-based rank of an item with this count (1 + items with a higher count)."""
+        return self.total - self._prefix(count) + 1
+
+    def _bump(self, count, delta):
+        size = len(self.fenwick) - 1
+        if count >= size:
+            self._grow(count)
+            size = len(self.fenwick) - 1
+        index = count + 1
+        while index <= size:
+            self.fenwick[index] += delta
+            index += index & -index
+
+    def _prefix(self, count):
+        """Number of items with a count <= `count`."""
+        index = min(count + 1, len(self.fenwick) - 1)
+        total = 0
+        while index > 0:
+            total += self.fenwick[index]
+            index -= index & -index
+        return total
+
+    def _grow(self, count):
+        size = max(64, len(self.fenwick) - 1)
+        while size <= count:
+            size *= 2
+        self.fenwick = [0] * (size + 1)
+        for bucket_count, bucket in self.buckets.items():
+            index = bucket_count + 1
+            while index <= size:
+                self.fenwick[index] += len(bucket)
+                index += index & -index
+
+class DueDateIndex:
+    """Books on loan as a sorted array keyed by (due_date, book_id), for range queries by date.
+
+    Only loaned books are in it, so reports never touch the books on the shelf.
+    Range lookups are a binary search; results are sliced out in due order.
+    """
+
+    def __init__(self):
+        self.keys = []     # (due_date, len(book_id), book_id), sorted; book_id ordered numerically
+        self.items = []    # Book for each key
+        self.pending = []  # (key, book) pairs added since the last lookup
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending)
+
+    @staticmethod
+    def _key(book, due_date):
+        return (due_date, len(book.book_id), book.book_id)
+
+    def add(self, book, due_date):
+        self.pending.append((self._key(book, due_date), book))
+
+    def remove(self, book, due_date):
+        self._merge()
+        key = self._key(book, due_date)
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            del self.keys[index]
+            del self.items[index]
+            return True
+        return False
+
+    def _merge(self):
+        if self.pending:
+            self.keys, self.items = merge_sorted(self.keys, self.items, self.pending)
+            self.pending = []
+
+    def range(self, start=None, end=None):
+        """Return the (lo, hi) positions of the books due on or after `start` and before `end`."""
+        self._merge()
+        lo = 0 if start is None else bisect.bisect_left(self.keys, (start,))
+        hi = len(self.keys) if end is None else bisect.bisect_left(self.keys, (end,), lo)
+        return lo, hi
+
+    def page(self, lo, hi, offset=0, limit=None):
+        """Return up to `limit` books from positions lo..hi, skipping the first `offset`."""
+        lo += offset
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self.items[lo:hi]
+
+def _words(name):
+    return set(name.lower().split())
+
+def _padded(member_id):
+    # Zero-padded, numeric IDs sort in numeric order
+    return member_id.rjust(20, "0")
+
+def _padded_id(member):
+    return _padded(member.member_id)
+
+class MemberDirectory:
+    """Members by ID (exact, prefix or numeric range) and by name (prefix or substring).
+
+    The n-gram index is over the distinct words of names, which members share far
+    more often than whole names, so it stays small and quick to build. Search results
+    are kept for the last query, so paging through them (as a virtual view does on
+    every scroll) costs O(limit) until a member is added or removed.
+    """
+
+    def __init__(self, members=()):
+        self.name_words = TrigramIndex()  # Each word of a name -> the members with it
+        self.name_prefix = PrefixIndex()
+        self.id_prefix = PrefixIndex()
+        self.id_order = PrefixIndex()  # Keyed by _padded(member_id)
+        self.version = 0
+        self._last = None  # (query, version, matches) of the last search
+
+        # Initial members are loaded in bulk: one sort per index instead of an insert each
+        members = list(members)
+        pairs = [(member, word) for member in members for word in _words(member.name)]
+        self.name_words.add_many([member for member, word in pairs], [word for member, word in pairs])
+        self.name_prefix.add_sorted(sorted(members, key=lambda member: member.name.lower()),
+                                    operator.attrgetter("name"))
+        self.id_prefix.add_sorted(sorted(members, key=lambda member: member.member_id.lower()),
+                                  operator.attrgetter("member_id"))
+        self.id_order.add_sorted(sorted(members, key=_padded_id), _padded_id)
+
+    def add(self, member):
+        for word in _words(member.name):
+            self.name_words.add(member, word)
+        self.name_prefix.add(member, member.name)
+        self.id_prefix.add(member, member.member_id)
+        self.id_order.add(member, _padded(member.member_id))
+        self.version += 1
+
+    def remove(self, member):
+        for word in _words(member.name):
+            self.name_words.remove(member, word)
+        self.name_prefix.remove(member, member.name)
+        self.id_prefix.remove(member, member.member_id)
+        self.id_order.remove(member, _padded(member.member_id))
+        self.version += 1
+
+    def settle(self):
+        """Bring the lazily updated indexes up to date, see Library.settle()."""
+        self.name_words._flush()
+        for index in (self.name_prefix, self.id_prefix, self.id_order):
+            index._merge()
+
+    def search(self, query, offset=0, limit=None):
+        """Return members matching `query`, paged.
+
+        The member whose ID is `query` comes first, then IDs starting with it, then
+        names starting with it, then (for queries of 3+ characters) names containing
+        it elsewhere; names in alphabetical order.
+        """
+        matches = self._matches(query)
+        return matches[offset:] if limit is None else matches[offset:offset + limit]
+
+    def count(self, query):
+        return len(self._matches(query))
+
+    def id_range(self, lo, hi, offset=0, limit=None):
+        """Return members with numeric IDs from `lo` through `hi`, in ID order, paged."""
+        start, end = self.id_order.between(_padded(str(lo)), _padded(str(hi)))
+        start += offset
+        if limit is not None:
+            end = min(end, start + limit)
+        return self.id_order.items[start:end]
+
+    def _matches(self, query):
+        query = query.strip().lower()
+        if self._last is not None and self._last[:2] == (query, self.version):
+            return self._last[2]
+        matches = []
+        if query:
+            lo, hi = self.id_prefix.range(query)
+            matches.extend(self.id_prefix.items[lo:hi])  # An exact ID sorts before longer ones
+            lo, hi = self.name_prefix.range(query)
+            matches.extend(self.name_prefix.items[lo:hi])
+            if len(query) >= 3:
+                # Short queries would match most of the directory; prefixes are enough there.
+                # Members with a word containing the query's longest word, then the whole query
+                rest = [member for member in self.name_words.search(max(query.split(), key=len))
+                        if query in member.name.lower() and not member.name.lower().startswith(query)]
+                rest.sort(key=lambda member: (member.name.lower(), len(member.member_id), member.member_id))
+                matches.extend(rest)
+            if len(matches) > 1:
+                matches = list({id(member): member for member in matches}.values())  # A member matched by ID and name
+        self._last = (query, self.version, matches)
+        return matches
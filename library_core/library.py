@@ -0,0 +1,913 @@
+import collections
+import contextlib
+import csv
+import datetime
+import gc
+
+from .autocomplete import PrefixIndex, TitleCompleter
+from .catalog import BookBST
+from .indexes import DueDateIndex, Leaderboard, MemberDirectory, TrigramIndex, match_score
+from .metrics import Metrics
+from .models import NO_WAITERS, Book, Member, Work
+from .reservations import WaitingList
+from .storage import write_csv
+
+def _title(book):
+    return book.title
+
+def _coalesce(events):
+    """Reduce (event, item) pairs to one per item, in first-change order."""
+    changes = {}
+    for event, item in events:
+        previous = changes.get(id(item))
+        if previous is None:
+            changes[id(item)] = (event, item)
+        elif event.endswith("_removed"):
+            if previous[0].endswith("_added"):
+                del changes[id(item)]  # Added and removed again: nothing to show
+            else:
+                changes[id(item)] = (event, item)
+        elif not previous[0].endswith("_added"):
+            changes[id(item)] = (event, item)
+    return list(changes.values())
+
+class Library:
+    def __init__(self):
+        self.books = BookBST()
+        self.title_index = TrigramIndex()
+        self.author_index = TrigramIndex()
+        self.title_prefix = PrefixIndex()
+        self.leaderboard = Leaderboard()  # Books by borrow_count, for most-borrowed queries
+        self.due_index = DueDateIndex()   # Books on loan by due date, for overdue reports
+        self.book_index = {}  # book_id -> Book
+        self.shelf = BookBST()    # Available books in title order, see _partition()
+        self.on_loan = BookBST()  # Books out on loan in title order
+        self.shelf_titles = collections.Counter()   # title -> copies on the shelf
+        self.shelf_authors = collections.Counter()  # author -> books on the shelf
+        self._partitioned = False
+        self.works = {}  # title -> Work, for titles that have circulated, see _work_for()
+        self.loans = {}       # member_id -> set of Books currently on loan to that member
+        self.members = {}
+        self.member_directory = None  # MemberDirectory, built on the first member search, see _directory()
+        self.next_book_id = 1
+        self.next_member_id = 1
+        self.storage = None  # Backend that receives every change, see open_storage()
+        self.reservation_days = None  # Days a waiting-list entry stays valid; None keeps it until served
+        self.compact_every = 1000  # Fewest changes between automatic compactions, see _compaction_due()
+        self.changes = 0  # Changes logged since the last compaction
+        self.listeners = []  # Callables notified of every change, see subscribe()
+        self.metrics = None  # Metrics being recorded, see enable_metrics()
+        self.sharded_search = None  # Process pool for find_books(), see enable_sharded_search()
+        self._batch_records = None  # Records and events held back while inside batch()
+        self._batch_events = None
+
+    def add_book(self, title, author):
+        book_id = str(self.next_book_id)
+        self._apply_add_book(book_id, title, author)
+        self._log("add_book", book_id=book_id, title=title, author=author)
+        self._serve_waiting(self.book_index[book_id])  # A new copy of a title with holds goes to the queue
+        return book_id
+
+    def _apply_add_book(self, book_id, title, author):
+        self.next_book_id = max(self.next_book_id, int(book_id) + 1)
+        book = Book(title, author, book_id)
+        self.books.insert(book)
+        self._index_book(book)
+        self._notify("book_added", book)
+
+    def _index_book(self, book):
+        self.book_index[book.book_id] = book
+        self.title_index.add(book, book.title)
+        self.author_index.add(book, book.author)
+        self.title_prefix.add(book, book.title)
+        self.leaderboard.add(book, book.borrow_count)
+        self._index_loan(book)
+        self._move_shelf(book, None)
+        work = self.works.get(book.title)
+        if work is not None:
+            work.add(book)
+
+    def _index_loan(self, book):
+        """Index a loaded book's loan state, if it is on loan."""
+        if book.due_date is not None:
+            self.due_index.add(book, book.due_date)
+        if book.borrowed_by is not None:
+            self.loans.setdefault(book.borrowed_by, set()).add(book)
+            member = self.members.get(book.borrowed_by)
+            if member and book.book_id not in member.books_borrowed:
+                member.books_borrowed.append(book.book_id)
+
+    def remove_book(self, book_id):
+        """Weed a book from the catalog and every index in O(log n). Returns False if it does not exist.
+
+        A copy still on loan comes off its member's loans. Holds stay queued for the
+        title's other copies and are dropped with its last one.
+        """
+        book = self.book_index.get(book_id)
+        if book is None:
+            return False
+        self._apply_remove_book(book)
+        self._log("remove_book", book_id=book_id)
+        return True
+
+    def remove_books(self, book_ids):
+        """Weed several books in one batch, see batch(). Returns whether each was removed, in order.
+
+        O(k log n) for k books; the title prefix index drops them all in one pass on its next lookup.
+        """
+        with self.batch():
+            return [self.remove_book(book_id) for book_id in book_ids]
+
+    def _apply_remove_book(self, book):
+        del self.book_index[book.book_id]
+        self.books.remove(book)
+        self.title_index.remove(book, book.title)
+        self.author_index.remove(book, book.author)
+        self.title_prefix.remove(book, book.title)
+        self.leaderboard.remove(book, book.borrow_count)
+        if book.due_date is not None:
+            self.due_index.remove(book, book.due_date)
+        member = None
+        if book.borrowed_by is not None:
+            member = self._end_loan(book, book.borrowed_by)
+        if self._partitioned:
+            (self.shelf if book.available else self.on_loan).remove(book)
+            if book.available:
+                self._count_shelf(book, -1)
+        work = book.work
+        if work is not None:
+            work.remove(book)
+            if not work.copies:
+                del self.works[work.title]
+        self._notify("book_removed", book)
+        if member:
+            self._notify("member_changed", member)
+
+    def _partition(self):
+        """Split the catalog into the shelf and on-loan sets, on first use. O(n), once."""
+        if self._partitioned:
+            return
+        with self._bulk_loading():
+            books = self.books.in_order()
+            shelf = [book for book in books if book.available]
+            self.shelf.build_from_sorted(shelf)
+            self.on_loan.build_from_sorted([book for book in books if not book.available])
+            self.shelf_titles = collections.Counter(book.title for book in shelf)
+            self.shelf_authors = collections.Counter(book.author for book in shelf)
+        self._partitioned = True
+
+    def _move_shelf(self, book, was_available):
+        """Update the shelf after a book was added (`was_available` None) or its availability changed."""
+        if not self._partitioned or book.available == was_available:
+            return
+        if was_available is not None:
+            (self.shelf if was_available else self.on_loan).remove(book)
+        (self.shelf if book.available else self.on_loan).insert(book)
+        if book.available or was_available:
+            self._count_shelf(book, 1 if book.available else -1)
+
+    def _count_shelf(self, book, step):
+        for counts, key in ((self.shelf_titles, book.title), (self.shelf_authors, book.author)):
+            counts[key] += step
+            if not counts[key]:
+                del counts[key]
+
+    def _work_for(self, book):
+        """Return the Work `book` is a copy of, grouping its title's copies on first use in O(log n + copies).
+
+        Titles that never circulate never get one. Every queued hold is on a Work.
+        """
+        work = book.work
+        if work is None:
+            work = self.works[book.title] = Work(book.title)
+            for copy in self.books.find(book.title):
+                work.add(copy)
+        return work
+
+    def _hold_id(self, book):
+        # Holds are journaled and saved under the work's first copy, so that every
+        # record for one queue names the same book
+        return book.work.copies[0].book_id if book.work is not None else book.book_id
+
+    def _saved_holds(self, book):
+        """The waiting list to save with `book`: its work's queue on the first copy, nothing on the others."""
+        return book.waiting_list if self._hold_id(book) == book.book_id else NO_WAITERS
+
+    def get_book(self, book_id):
+        """Return the book with this ID, or None."""
+        return self.book_index.get(book_id)
+
+    def get_loans(self, member_id):
+        """Return the books currently on loan to a member, in title order."""
+        return sorted(self.loans.get(member_id, ()), key=BookBST._key)
+
+    def title_completer(self):
+        """Return a TitleCompleter for one input field (it remembers that field's last prefix)."""
+        return TitleCompleter(self)
+
+    def member_loans(self, member_id):
+        """Return (book_id, title, due_date) for each book on a member's borrowed list, in borrow order.
+
+        Costs O(member's loans). An entry whose book no longer exists, or is not on loan
+        to this member, comes back with title and due_date set to None.
+        """
+        member = self.members.get(member_id)
+        if member is None:
+            return []
+        loans = self.loans.get(member_id, ())
+        entries = []
+        for book_id in member.books_borrowed:
+            book = self.book_index.get(book_id)
+            if book is None or book not in loans:
+                entries.append((book_id, None, None))
+            else:
+                entries.append((book_id, book.title, book.due_date))
+        return entries
+
+    def search_books(self, query, include_author=False):
+        """Return books whose title (or author) contains `query`, case-insensitive, in title order."""
+        matches = self.title_index.search(query)
+        if include_author:
+            matches |= self.author_index.search(query)
+        return sorted(matches, key=BookBST._key)
+
+    def find_books(self, query, include_author=False, available_only=False):
+        """Return books matching every word of `query` in the title (or author), case-insensitive.
+
+        Books matching more words in the title rank first; ties are in title order.
+        Runs on the sharded process pool when enabled, otherwise on the trigram indexes.
+        With `available_only`, books on loan are dropped before anything is ranked.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return []
+        if self.sharded_search is not None:
+            books = self.sharded_search.search(terms, include_author)
+            return [book for book in books if book.available] if available_only else books
+        # Candidates for the longest word, then check the others on each candidate
+        anchor = max(terms, key=len)
+        candidates = self.title_index.search(anchor)
+        if include_author:
+            candidates |= self.author_index.search(anchor)
+        if available_only:
+            candidates = [book for book in candidates if book.available]
+        scored = []
+        for book in sorted(candidates, key=BookBST._key):
+            score = match_score(terms, book.title.lower(), book.author.lower(), include_author)
+            if score:
+                scored.append((score, book))
+        scored.sort(key=lambda pair: -pair[0])  # Stable, so ties stay in title order
+        return [book for score, book in scored]
+
+    def enable_sharded_search(self, workers=None):
+        """Serve find_books() from a pool of `workers` processes (default: one per core).
+
+        Worth it for multi-million-book catalogs on machines with several cores.
+        """
+        from .sharded import ShardedSearch  # multiprocessing is only loaded when asked for
+
+        if self.sharded_search is None:
+            self.sharded_search = ShardedSearch(self, workers)
+        return self.sharded_search
+
+    def settle(self):
+        """Bring the lazily updated search indexes up to date, so that queries no longer modify them.
+
+        Lets queries run on several threads at once between changes (see server.LibraryServer).
+        """
+        self.title_index._flush()
+        self.author_index._flush()
+        self.title_prefix._merge()
+        self.due_index._merge()
+        self._partition()
+        self._directory().settle()
+
+    def add_member(self, name):
+        member_id = str(self.next_member_id)
+        self._apply_add_member(member_id, name)
+        self._log("add_member", member_id=member_id, name=name)
+        return member_id
+
+    def _apply_add_member(self, member_id, name):
+        self.next_member_id = max(self.next_member_id, int(member_id) + 1)
+        member = Member(name, member_id)
+        self.members[member_id] = member
+        if self.member_directory is not None:
+            self.member_directory.add(member)
+        self._notify("member_added", member)
+
+    def remove_member(self, member_id):
+        """Delete a member. Returns False if the member does not exist."""
+        if member_id not in self.members:
+            return False
+        self._apply_remove_member(member_id)
+        self._log("delete_member", member_id=member_id)
+        return True
+
+    def _apply_remove_member(self, member_id):
+        member = self.members.pop(member_id)
+        if self.member_directory is not None:
+            self.member_directory.remove(member)
+        self._notify("member_removed", member)
+
+    def _directory(self):
+        if self.member_directory is None:
+            with self._bulk_loading():
+                directory = MemberDirectory(self.members.values())
+                directory.settle()
+            self.member_directory = directory
+        return self.member_directory
+
+    def search_members(self, query, offset=0, limit=None):
+        """Return members whose ID or name matches `query`, paged; see MemberDirectory.search()."""
+        return self._directory().search(query, offset, limit)
+
+    def count_members(self, query):
+        """Return how many members search_members(query) finds in all."""
+        return self._directory().count(query)
+
+    def members_in_range(self, lo, hi, offset=0, limit=None):
+        """Return members with numeric IDs from `lo` through `hi`, in ID order, paged."""
+        return self._directory().id_range(lo, hi, offset, limit)
+
+    def borrow_book(self, book_title, member_id, days=14):
+        if member_id not in self.members:
+            return False, "Member Not Found"
+
+        return self._borrow_from(self.find_work(book_title), member_id, days)
+
+    def find_work(self, book_title):
+        """Return the Work titled exactly `book_title`, else the first in title order whose title contains it, or None."""
+        work = self.works.get(book_title)
+        if work is None:
+            books = self.books.find(book_title) or self.search_books(book_title)
+            if books:
+                work = self._work_for(books[0])
+        return work
+
+    def _borrow_from(self, work, member_id, days):
+        """Lend a free copy of `work` in O(1), or queue the member for whichever copy comes back first."""
+        if work is None:
+            return False, "Book Not Found"
+
+        if work.free:
+            book = work.free[-1]
+            self._lend(book, member_id, days)
+            return True, f"Book '{book.title}' borrowed successfully!"
+
+        # Add to waiting list
+        expires = None
+        if self.reservation_days is not None:
+            expires = datetime.date.today() + datetime.timedelta(days=self.reservation_days)
+        if not work.reserve(member_id, expires):
+            return False, "You are already on the waiting list for this book."
+        self._log("enqueue", book_id=work.copies[0].book_id, member_id=member_id,
+                  expires=expires.isoformat() if expires else None)
+        return False, f"Book is currently unavailable. Added to the waiting list."
+
+    def borrow_many(self, requests, days=14):
+        """Borrow several books in one batch, see batch().
+
+        `requests` are (book_title, member_id) pairs. Each distinct title is looked up
+        once. Returns a (success, message) pair per request, in order.
+        """
+        found = {}
+        with self.batch():
+            return [self._batch_borrow(found, book_title, member_id, days) for book_title, member_id in requests]
+
+    def _batch_borrow(self, found, book_title, member_id, days):
+        if member_id not in self.members:
+            return False, "Member Not Found"
+        if book_title not in found:
+            found[book_title] = self.find_work(book_title)
+        return self._borrow_from(found[book_title], member_id, days)
+
+    def _lend(self, book, member_id, days=14):
+        due_date = datetime.datetime.now().date() + datetime.timedelta(days=days)
+        self._apply_borrow(book, member_id, due_date, book.borrow_count + 1)
+        self._log("borrow", book_id=book.book_id, member_id=member_id,
+                  due_date=due_date.isoformat(), borrow_count=book.borrow_count)
+
+    def _apply_borrow(self, book, member_id, due_date, borrow_count):
+        was_available = book.available
+        book.available = False
+        self._move_shelf(book, was_available)
+        if was_available and book.work is not None:
+            book.work.take(book)
+        book.borrowed_by = member_id
+        if book.due_date is not None:
+            self.due_index.remove(book, book.due_date)
+        book.due_date = due_date
+        self.due_index.add(book, due_date)
+        self._set_borrow_count(book, borrow_count)
+        member = self.members.get(member_id)
+        if member and book.book_id not in member.books_borrowed:
+            member.books_borrowed.append(book.book_id)  # Track borrowed books in the member object
+        self.loans.setdefault(member_id, set()).add(book)
+        self._notify("book_changed", book)
+        if member:
+            self._notify("member_changed", member)
+
+    def _set_borrow_count(self, book, borrow_count):
+        self.leaderboard.update(book, book.borrow_count, borrow_count)
+        book.borrow_count = borrow_count
+
+    def return_book(self, book_id, member_id):
+        book = self.book_index.get(book_id)
+        if book is None or book.borrowed_by != member_id:
+            return False, 'Book not found or invalid member ID.'
+
+        self._apply_return(book)
+        self._log("return", book_id=book_id, member_id=member_id)
+        self._serve_waiting(book)
+        return True, 'Book returned successfully.'
+
+    def _serve_waiting(self, book):
+        """Lend a copy that just became free to the next member waiting for its work.
+
+        Skips expired reservations and members who have since been removed. A free
+        copy never sits on the shelf while its work has holds, so walk-ins cannot
+        jump the queue.
+        """
+        hold_id = self._hold_id(book)
+        for expired_id in book.waiting_list.expire(datetime.date.today()):
+            self._log("dequeue", book_id=hold_id, member_id=expired_id)
+        while book.waiting_list:
+            next_member_id = book.waiting_list.popleft()
+            self._log("dequeue", book_id=hold_id, member_id=next_member_id)
+            if next_member_id in self.members:
+                self._lend(book, next_member_id)
+                break
+
+    def return_many(self, returns):
+        """Return several books in one batch, see batch().
+
+        `returns` are (book_id, member_id) pairs. Returns a (success, message) pair per item, in order.
+        """
+        with self.batch():
+            return [self.return_book(book_id, member_id) for book_id, member_id in returns]
+
+    def process_batch_file(self, filename, days=14):
+        """Run a CSV file of loans and returns in one batch, see batch().
+
+        Columns are action ("borrow", "return" or "remove"), book (a title to borrow, or
+        the book_id being returned or weeded) and member_id (blank for "remove").
+        Returns a (success, message) pair per row. Every row is checked before any is
+        applied, so a malformed file raises ValueError and changes nothing.
+        """
+        with open(filename, mode="r", newline="") as file:
+            reader = csv.DictReader(file)
+            rows = list(reader)
+        missing = {"action", "book"}.difference(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}")
+        entries = []
+        for number, row in enumerate(rows, start=2):  # Row numbers as seen in a spreadsheet
+            # DictReader gives None for fields missing at the end of a short row
+            action, book, member_id = ((row.get(column) or "").strip() for column in ("action", "book", "member_id"))
+            if action.lower() not in ("borrow", "return", "remove"):
+                raise ValueError(f"Row {number}: unknown action '{action}'")
+            if not book:
+                raise ValueError(f"Row {number}: no book given")
+            if action.lower() in ("borrow", "return") and not member_id:
+                raise ValueError(f"Row {number}: no member_id given")
+            entries.append((action.lower(), book, member_id))
+
+        found = {}
+        results = []
+        with self.batch():
+            for action, book, member_id in entries:
+                if action == "borrow":
+                    results.append(self._batch_borrow(found, book, member_id, days))
+                elif action == "return":
+                    results.append(self.return_book(book, member_id))
+                else:
+                    results.append((True, "Book removed.") if self.remove_book(book) else (False, "Book not found."))
+        return results
+
+    def _apply_return(self, book):
+        member_id = book.borrowed_by
+        was_available = book.available
+        book.available = True
+        self._move_shelf(book, was_available)
+        if not was_available and book.work is not None:
+            book.work.free.append(book)
+        book.borrowed_by = None
+        if book.due_date is not None:
+            self.due_index.remove(book, book.due_date)
+        book.due_date = None
+        member = self._end_loan(book, member_id)
+        self._notify("book_changed", book)
+        if member:
+            self._notify("member_changed", member)
+
+    def _end_loan(self, book, member_id):
+        """Take `book` off a member's loans. Returns the Member, or None if they no longer exist."""
+        loans = self.loans.get(member_id)
+        if loans is not None:
+            loans.discard(book)
+            if not loans:
+                del self.loans[member_id]
+        member = self.members.get(member_id)
+        if member and book.book_id in member.books_borrowed:
+            member.books_borrowed.remove(book.book_id)  # Remove the book from the member's borrowed list
+        return member
+
+    def cancel_reservation(self, book_id, member_id):
+        """Take a member off the waiting list of a book's work. Returns False if they were not on it."""
+        book = self.book_index.get(book_id)
+        if book is None or not book.waiting_list.remove(member_id):
+            return False
+        self._log("dequeue", book_id=self._hold_id(book), member_id=member_id)
+        return True
+
+    def reservation_position(self, book_id, member_id):
+        """Return a member's 1-based place in the waiting list of a book's work, or None if they are not on it."""
+        book = self.book_index.get(book_id)
+        return book.waiting_list.position(member_id) if book else None
+
+    def subscribe(self, listener):
+        """Call `listener(event, item)` after every change.
+
+        Events are "book_added", "book_changed" and "book_removed" (item is the Book), and
+        "member_added", "member_changed" and "member_removed" (item is the Member).
+        Changes made inside batch() arrive as one "batch" event whose item is a list
+        of (event, item) pairs, one per changed book or member.
+        """
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Stop calling a listener added with subscribe()."""
+        self.listeners.remove(listener)
+
+    def _notify(self, event, item):
+        if self._batch_events is not None:
+            self._batch_events.append((event, item))
+            return
+        for listener in self.listeners:
+            listener(event, item)
+
+    def open_storage(self, storage):
+        """Load the library from a storage backend and send every further change to it."""
+        if self.metrics is not None:
+            self._instrument_storage(storage)
+        storage.load(self)
+        self.storage = storage
+
+    def enable_metrics(self, metrics=None):
+        """Start timing the public operations (and the storage backend's writes) into `metrics`.
+
+        Returns the Metrics in use. Search calls also record the rows they scanned,
+        and storage writes the bytes they wrote.
+        """
+        if self.metrics is not None:
+            return self.metrics
+        self.metrics = metrics or Metrics()
+        self.metrics.instrument(self, (
+            "add_book", "remove_book", "remove_books", "add_member", "remove_member", "borrow_book", "return_book", "cancel_reservation",
+            "borrow_many", "return_many", "process_batch_file",
+            "get_most_borrowed_books", "list_books", "member_loans", "compact",
+            "save_books_to_csv", "load_books_from_csv", "save_members_to_csv", "load_members_from_csv",
+        ), "library_")
+        self.metrics.instrument(self, ("search_books", "find_books"), "library_", {
+            "rows_scanned": self._rows_scanned,
+        })
+        if self.storage is not None:
+            self._instrument_storage(self.storage)
+        return self.metrics
+
+    def _rows_scanned(self):
+        scanned = self.title_index.scanned + self.author_index.scanned
+        if self.sharded_search is not None:
+            scanned += self.sharded_search.scanned
+        return scanned
+
+    def _instrument_storage(self, storage):
+        # Time the backend itself, not a PersistenceWorker's queueing in front of it
+        backend = getattr(storage, "storage", storage)
+        totals = None
+        if hasattr(backend, "bytes_written"):
+            totals = {"bytes": lambda: backend.bytes_written}
+        self.metrics.instrument(backend, ("load",), "storage_")
+        writes = [name for name in ("record", "record_many", "write_snapshot") if hasattr(backend, name)]
+        self.metrics.instrument(backend, writes, "storage_", totals)
+
+    def next_ids(self):
+        """Return the ID counters as a record for replay(), for backends whose snapshots do not hold them."""
+        return {"op": "next_ids", "next_book_id": self.next_book_id, "next_member_id": self.next_member_id}
+
+    def replay(self, record):
+        """Apply one change record without logging it again."""
+        op = record["op"]
+        book = self.book_index.get(record.get("book_id"))
+        if op == "add_book":
+            if book is None:
+                self._apply_add_book(record["book_id"], record["title"], record["author"])
+        elif op == "remove_book":
+            if book is not None:
+                self._apply_remove_book(book)
+        elif op == "next_ids":
+            self.next_book_id = max(self.next_book_id, record.get("next_book_id", 1))
+            self.next_member_id = max(self.next_member_id, record.get("next_member_id", 1))
+        elif op == "add_member":
+            if record["member_id"] not in self.members:
+                self._apply_add_member(record["member_id"], record["name"])
+        elif op == "delete_member":
+            if record["member_id"] in self.members:
+                self._apply_remove_member(record["member_id"])
+        elif op == "borrow":
+            if book is not None:
+                if book.borrowed_by is not None:
+                    self._apply_return(book)
+                due_date = datetime.date.fromisoformat(record["due_date"])
+                self._apply_borrow(book, record["member_id"], due_date, record["borrow_count"])
+        elif op == "return":
+            if book is not None and book.borrowed_by == record["member_id"]:
+                self._apply_return(book)
+        elif op == "enqueue":
+            if book is not None:
+                expires = record.get("expires")
+                self._work_for(book).reserve(record["member_id"], expires and datetime.date.fromisoformat(expires))
+        elif op == "dequeue":
+            if book is not None:
+                book.waiting_list.remove(record["member_id"])
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Group the changes made inside the block.
+
+        Their records reach the storage backend in a single record_many() call (one
+        journal write, or one SQLite transaction), and listeners get one "batch"
+        event when the block exits.
+        """
+        if self._batch_records is not None:
+            yield  # Already inside a batch
+            return
+        self._batch_records, self._batch_events = [], []
+        try:
+            yield
+        finally:
+            records, events = self._batch_records, self._batch_events
+            self._batch_records = self._batch_events = None
+            if records:
+                self.storage.record_many(records)
+                self.changes += len(records)
+                if self._compaction_due():
+                    self.compact()
+            if events:
+                self._notify("batch", _coalesce(events))
+
+    def _log(self, op, **fields):
+        if self.storage is None:
+            return
+        fields["op"] = op
+        if self._batch_records is not None:
+            self._batch_records.append(fields)
+            return
+        self.storage.record(fields)
+        self.changes += 1
+        if self._compaction_due():
+            self.compact()
+
+    def _compaction_due(self):
+        # Capturing a snapshot costs O(catalog), so wait until the log has grown by a
+        # quarter of the catalog: O(1) per change, amortized, at any catalog size
+        if not self.compact_every:
+            return False
+        return self.changes >= max(self.compact_every, (len(self.book_index) + len(self.members)) // 4)
+
+    def compact(self):
+        """Let the storage backend fold its change log into its snapshot."""
+        if self.storage is not None:
+            self.changes = 0
+            self.storage.compact(self)
+
+    def close(self):
+        """Compact and close the storage backend, and stop the search processes."""
+        if self.sharded_search is not None:
+            self.sharded_search.close()
+            self.sharded_search = None
+        if self.storage is not None:
+            self.compact()
+            self.storage.close()
+            self.storage = None
+
+    def list_books(self):
+        return self.books.in_order()
+
+    def available_books(self, offset=0, limit=None):
+        """Return books on the shelf in title order, paged, in O(log n + limit)."""
+        self._partition()
+        return self.shelf.page(offset, len(self.shelf) if limit is None else limit)
+
+    def count_available(self, title=None, author=None):
+        """Return how many books are on the shelf: all of them, or copies of `title`, or by `author`. O(1)."""
+        self._partition()
+        if title is not None:
+            return self.shelf_titles[title]
+        if author is not None:
+            return self.shelf_authors[author]
+        return len(self.shelf)
+
+    def overdue_books(self, as_of=None, offset=0, limit=None):
+        """Return books due before `as_of` (default today), earliest due first, paged."""
+        lo, hi = self.due_index.range(end=as_of or datetime.date.today())
+        return self.due_index.page(lo, hi, offset, limit)
+
+    def count_overdue(self, as_of=None):
+        """Return how many books are due before `as_of` (default today)."""
+        lo, hi = self.due_index.range(end=as_of or datetime.date.today())
+        return hi - lo
+
+    def books_due_within(self, days, as_of=None, offset=0, limit=None):
+        """Return books due from `as_of` (default today) through `days` days later, earliest first, paged."""
+        start = as_of or datetime.date.today()
+        lo, hi = self.due_index.range(start, start + datetime.timedelta(days=days + 1))
+        return self.due_index.page(lo, hi, offset, limit)
+
+    def earliest_due(self, limit=1):
+        """Return the `limit` books on loan that are due soonest."""
+        lo, hi = self.due_index.range()
+        return self.due_index.page(lo, hi, 0, limit)
+
+    def get_most_borrowed_books(self, top_n=5):
+        """Get the top N most borrowed books, in O(top_n) from the leaderboard.
+
+        Books with the same borrow_count come back in the order they reached it.
+        """
+        return self.leaderboard.top(top_n)
+
+    def borrow_rank(self, book_id):
+        """Return a book's 1-based position by borrow_count (ties share a rank), or None."""
+        book = self.book_index.get(book_id)
+        if book is None:
+            return None
+        return self.leaderboard.rank(book.borrow_count)
+
+    def books_borrowed_at_least(self, count):
+        """Return every book borrowed at least `count` times, most borrowed first."""
+        return self.leaderboard.at_least(count)
+
+    def book_rows(self):
+        """Return all books as CSV rows, header first, in title order."""
+        rows = [["book_id", "title", "author", "available", "borrowed_by", "due_date", "borrow_count",
+                 "waiting_list"]]
+        rows.extend([
+            book.book_id,
+            book.title,
+            book.author,
+            book.available,
+            book.borrowed_by,
+            book.due_date.strftime('%Y-%m-%d') if book.due_date else "",
+            book.borrow_count,
+            self._saved_holds(book).dumps()
+        ] for book in self.books.in_order())
+        return rows
+
+    def save_books_to_csv(self, filename="books.csv"):
+        """Save all books to a CSV file."""
+        write_csv(filename, self.book_rows())
+
+    def load_books_from_csv(self, filename="books.csv"):
+        """Load books from a CSV file.
+
+        Rows are streamed into Book objects in one pass. save_books_to_csv writes them
+        in title order, so the title tree can usually be built bottom-up in O(n).
+        Members should be loaded first so their loan lists are wired up in the same pass.
+        """
+        try:
+            file = open(filename, mode="r", newline="")
+        except FileNotFoundError:
+            return  # If the file doesn't exist, start with an empty library
+
+        books = []
+        in_order = True
+        key = BookBST._key
+        parse_date = datetime.date.fromisoformat  # Fixed YYYY-MM-DD format, far cheaper than strptime
+        with file, self._bulk_loading():
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                return
+            column = {name: index for index, name in enumerate(header)}
+            id_col, title_col, author_col = column["book_id"], column["title"], column["author"]
+            available_col, borrowed_by_col = column["available"], column["borrowed_by"]
+            due_date_col, count_col = column["due_date"], column["borrow_count"]
+            waiting_col = column.get("waiting_list")  # Missing from files written before it was added
+
+            last_key = None
+            for row in reader:
+                book = Book(row[title_col], row[author_col], row[id_col])
+                if row[available_col] != "True":
+                    book.available = False
+                if row[borrowed_by_col]:
+                    book.borrowed_by = row[borrowed_by_col]
+                if row[due_date_col]:
+                    book.due_date = parse_date(row[due_date_col])
+                book.borrow_count = int(row[count_col])
+                if waiting_col is not None and row[waiting_col]:
+                    for member_id, expires in WaitingList.loads(row[waiting_col]):
+                        book.reserve(member_id, expires)
+                books.append(book)
+
+                if in_order:
+                    book_key = key(book)
+                    if last_key is not None and book_key < last_key:
+                        in_order = False
+                    last_key = book_key
+
+            self._load_books(books, in_order)
+
+    @contextlib.contextmanager
+    def _bulk_loading(self):
+        # Loading creates millions of objects and no reference cycles, so the cyclic
+        # collector would only rescan them over and over; pause it until done
+        was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            yield
+        finally:
+            if was_enabled:
+                gc.enable()
+
+    def _load_books(self, books, in_order=False, prefix_order=None):
+        """Add freshly loaded books to the catalog and every index in bulk.
+
+        `prefix_order`, if given, is the same books sorted by lowercase title, as
+        stored in a binary snapshot.
+        """
+        if not books:
+            return
+        if not self.books.root:
+            if not in_order:
+                books.sort(key=BookBST._key)
+            self.books.build_from_sorted(books)
+        else:
+            for book in books:
+                self.books.insert(book)
+
+        was_empty = not self.book_index
+        self.book_index.update((book.book_id, book) for book in books)
+        self.title_index.add_many(books, [book.title for book in books])
+        self.author_index.add_many(books, [book.author for book in books])
+        if prefix_order is not None and was_empty:
+            self.title_prefix.add_sorted(prefix_order, _title)
+        else:
+            for book in books:
+                self.title_prefix.add(book, book.title)
+        self.leaderboard.add_many(books, [book.borrow_count for book in books])
+        for book in books:
+            if book.borrowed_by is not None or book.due_date is not None:
+                self._index_loan(book)
+        if self._partitioned:
+            for book in books:
+                self._move_shelf(book, None)
+        if self.works:
+            for book in books:
+                work = self.works.get(book.title)
+                if work is not None:
+                    work.add(book)
+        for book in books:
+            if book.waiting_list:
+                self._work_for(book)  # Loaded holds join their title's shared queue
+
+        # Set next_book_id past the highest book ID
+        self.next_book_id = max(self.next_book_id, max(map(int, self.book_index)) + 1)
+
+    def member_rows(self):
+        """Return all members as CSV rows, header first."""
+        rows = [["member_id", "name", "books_borrowed"]]
+        rows.extend([
+            member_id,
+            member.name,
+            ",".join(member.books_borrowed)  # Save borrowed books as a comma-separated string
+        ] for member_id, member in self.members.items())
+        return rows
+
+    def save_members_to_csv(self, filename="members.csv"):
+        """Save all members to a CSV file."""
+        write_csv(filename, self.member_rows())
+
+    def load_members_from_csv(self, filename="members.csv"):
+        """Load members from a CSV file."""
+        try:
+            with open(filename, mode="r") as file:
+                reader = csv.DictReader(file)
+                max_member_id = 0  # Track the highest member ID
+                for row in reader:
+                    member = Member(
+                        name=row["name"],
+                        member_id=row["member_id"]
+                    )
+                    # Load borrowed books as a list
+                    member.books_borrowed = row["books_borrowed"].split(",") if row["books_borrowed"] else []
+                    self.members[member.member_id] = member
+
+                    # Update max_member_id
+                    max_member_id = max(max_member_id, int(member.member_id))
+
+                # Set next_member_id to the highest member ID + 1
+                self.next_member_id = max_member_id + 1
+                self.member_directory = None  # Rebuilt with the loaded members on the next search
+        except FileNotFoundError:
+            pass  # If the file doesn't exist, start with an empty member list
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+
+# Histogram bucket upper bounds: latencies in seconds, and sizes (rows, bytes)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (1, 10, 100, 1000, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot counts values above every bound
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+class Metrics:
+    """Call counts and histograms for instrumented methods.
+
+    Nothing is measured until instrument() wraps an object's methods, so code that
+    never enables metrics pays nothing. Wrapped methods may run on several threads
+    (e.g. a PersistenceWorker), hence the lock.
+    """
+
+    def __init__(self):
+        self.histograms = {}  # name -> Histogram
+        self.lock = threading.Lock()
+        self.profiler = None
+        self._dump_timer = None
+        self._dumping = False  # Set by dump_every(), cleared by stop_dumping()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def wrap(self, name, func, totals=None):
+        """Return `func` timed into the histogram `name`_seconds.
+
+        `totals` maps a suffix to a callable returning a running total (rows scanned,
+        bytes written); how much each call adds is recorded into `name`_<suffix>.
+        """
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            before = {suffix: total() for suffix, total in totals.items()} if totals else None
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(name + "_seconds", clock() - start)
+                if totals:
+                    for suffix, total in totals.items():
+                        self.observe(f"{name}_{suffix}", total() - before[suffix], SIZE_BUCKETS)
+
+        timed.__wrapped__ = func
+        return timed
+
+    def instrument(self, obj, names, prefix, totals=None):
+        """Replace the methods `names` of `obj` (on the instance only) with timed wrappers."""
+        for name in names:
+            setattr(obj, name, self.wrap(prefix + name, getattr(obj, name), totals))
+
+    def snapshot(self):
+        """Return {name: {"count", "sum", "buckets": [[upper_bound, cumulative_count], ...]}}."""
+        with self.lock:
+            result = {}
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                buckets = []
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    buckets.append([bound, cumulative])
+                result[name] = {"count": histogram.count, "sum": histogram.sum, "buckets": buckets}
+            return result
+
+    def to_json(self):
+        # JSON has no infinity, so the overflow bucket is written as "+Inf" like Prometheus does
+        snapshot = self.snapshot()
+        for data in snapshot.values():
+            data["buckets"][-1][0] = "+Inf"
+        return json.dumps(snapshot, indent=2)
+
+    def to_prometheus(self):
+        """Render every histogram in the Prometheus text exposition format."""
+        lines = []
+        for name, data in self.snapshot().items():
+            lines.append(f"# TYPE {name} histogram")
+            for bound, count in data["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{le="{le}"}} {count}')
+            lines.append(f"{name}_sum {data['sum']}")
+            lines.append(f"{name}_count {data['count']}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, filename):
+        """Atomically write the metrics to `filename`: Prometheus text for .prom files, JSON otherwise."""
+        text = self.to_prometheus() if filename.endswith(".prom") else self.to_json()
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, mode="w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temp_filename, filename)
+
+    def dump_every(self, filename, interval=60.0):
+        """Dump to `filename` every `interval` seconds on a daemon timer thread until stop_dumping()."""
+        with self.lock:
+            self._dumping = True
+        self._schedule_dump(filename, interval)
+
+    def _schedule_dump(self, filename, interval):
+        def tick():
+            self.dump(filename)
+            self._schedule_dump(filename, interval)
+
+        with self.lock:
+            if not self._dumping:  # stop_dumping() was called while this tick was dumping
+                return
+            self._dump_timer = threading.Timer(interval, tick)
+            self._dump_timer.daemon = True
+            self._dump_timer.start()
+
+    def stop_dumping(self):
+        """Stop dump_every(). Waits for a dump under way, so that a dump() after this is the last write."""
+        with self.lock:
+            self._dumping = False
+            timer, self._dump_timer = self._dump_timer, None
+        if timer is not None:
+            timer.cancel()
+            if timer is not threading.current_thread():
+                timer.join()
+
+    def start_profile(self):
+        """Start a cProfile capture of the calling thread."""
+        import cProfile  # Only loaded when someone actually profiles
+
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+
+    def stop_profile(self, filename=None):
+        """Stop the capture and return its stats, sorted by cumulative time; also saved to `filename` if given."""
+        import io
+        import pstats
+
+        self.profiler.disable()
+        if filename:
+            self.profiler.dump_stats(filename)
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(30)
+        self.profiler = None
+        return out.getvalue()
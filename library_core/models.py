@@ -0,0 +1,89 @@
+import sys
+
+from .reservations import WaitingList
+
+NO_WAITERS = WaitingList()  # Shared by every book nobody is queued for; never append to it directly
+
+class Book:
+    # Slotted: a large catalog holds millions of these, and a per-instance __dict__ would dominate
+    __slots__ = ("title", "author", "book_id", "available", "borrowed_by", "due_date",
+                 "_waiting_list", "borrow_count", "work")
+
+    def __init__(self, title, author, book_id):
+        self.title = title
+        self.author = sys.intern(author)  # Many books share an author; keep one copy of the string
+        self.book_id = book_id
+        self.available = True
+        self.borrowed_by = None
+        self.due_date = None
+        self._waiting_list = None  # Allocated by reserve(), most books never need one
+        self.borrow_count = 0
+        self.work = None  # The Work this is a copy of, once the library has grouped its copies
+
+    @property
+    def waiting_list(self):
+        """Members queued for this book, in order; shared by every copy once it belongs to a Work."""
+        if self.work is not None:
+            return self.work.waiting_list
+        return NO_WAITERS if self._waiting_list is None else self._waiting_list
+
+    def reserve(self, member_id, expires=None):
+        """Queue a member for this book. Returns False if they are already queued."""
+        if self.work is not None:
+            return self.work.reserve(member_id, expires)
+        if self._waiting_list is None:
+            self._waiting_list = WaitingList()
+        return self._waiting_list.append(member_id, expires)
+
+class Work:
+    """Every copy of one title, with a stack of the free copies and one hold queue for all of them."""
+
+    __slots__ = ("title", "copies", "free", "_waiting_list")
+
+    def __init__(self, title):
+        self.title = title
+        self.copies = []  # Books, in the order they joined
+        self.free = []    # Available copies; the last one is lent next
+        self._waiting_list = None
+
+    def add(self, book):
+        """Make `book` a copy of this work. Holds already queued on the book move to the shared queue."""
+        queued = book.waiting_list
+        book.work = self
+        book._waiting_list = None
+        self.copies.append(book)
+        if book.available:
+            self.free.append(book)
+        for member_id, expires in queued.items():
+            self.reserve(member_id, expires)
+
+    def take(self, book):
+        """Remove a copy that was just lent from the free stack. O(1) for the copy on top."""
+        if self.free and self.free[-1] is book:
+            self.free.pop()
+        else:
+            self.free.remove(book)  # A specific copy, e.g. when replaying the journal
+
+    def remove(self, book):
+        """Drop a weeded copy. The holds stay queued for the remaining copies."""
+        self.copies.remove(book)
+        if book in self.free:
+            self.free.remove(book)
+        book.work = None
+
+    @property
+    def waiting_list(self):
+        return NO_WAITERS if self._waiting_list is None else self._waiting_list
+
+    def reserve(self, member_id, expires=None):
+        if self._waiting_list is None:
+            self._waiting_list = WaitingList()
+        return self._waiting_list.append(member_id, expires)
+
+class Member:
+    __slots__ = ("name", "member_id", "books_borrowed")
+
+    def __init__(self, name, member_id):
+        self.name = name
+        self.member_id = member_id
+        self.books_borrowed = []
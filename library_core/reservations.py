@@ -0,0 +1,124 @@
+import datetime
+from collections import OrderedDict
+
+class WaitingList:
+    """First-come-first-served queue of member IDs waiting for a book.
+
+    Enqueue, dequeue and cancel are O(1) and a member can only be queued once.
+    Every entry gets an increasing sequence number; a Fenwick tree over those
+    numbers gives a member's position in O(log n) without walking the queue.
+    An entry may carry an expiry date, after which it is dropped from the front.
+    """
+
+    __slots__ = ("entries", "fenwick", "next_sequence")
+
+    def __init__(self):
+        self.entries = OrderedDict()  # member_id -> (sequence, expires)
+        self.fenwick = [0]  # Fenwick tree over sequence numbers, 1 while the entry is still queued
+        self.next_sequence = 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __contains__(self, member_id):
+        return member_id in self.entries
+
+    def append(self, member_id, expires=None):
+        """Queue a member at the back. Returns False if they are already queued."""
+        if member_id in self.entries:
+            return False
+        if self.next_sequence >= len(self.fenwick):
+            self._renumber()
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        self.entries[member_id] = (sequence, expires)
+        self._bump(sequence, 1)
+        return True
+
+    def remove(self, member_id):
+        """Take a member out of the queue. Returns False if they were not queued."""
+        entry = self.entries.pop(member_id, None)
+        if entry is None:
+            return False
+        self._bump(entry[0], -1)
+        return True
+
+    def popleft(self):
+        """Remove and return the member at the front, or None if the queue is empty."""
+        if not self.entries:
+            return None
+        member_id, (sequence, _) = self.entries.popitem(last=False)
+        self._bump(sequence, -1)
+        return member_id
+
+    def expire(self, today):
+        """Drop the entries at the front whose expiry date is before `today`, and return their member IDs.
+
+        Entries get their expiry dates in arrival order (see Library.reservation_days),
+        so this stops at the first one still valid: O(1 + expired), and O(1) for a
+        queue without expiry dates.
+        """
+        expired = []
+        while self.entries:
+            member_id, (_, expires) = next(iter(self.entries.items()))
+            if expires is None or expires >= today:
+                break
+            self.popleft()
+            expired.append(member_id)
+        return expired
+
+    def items(self):
+        """Iterate (member_id, expires) pairs in queue order."""
+        return ((member_id, expires) for member_id, (_, expires) in self.entries.items())
+
+    def expires(self, member_id):
+        """Return the expiry date of a member's entry, or None."""
+        entry = self.entries.get(member_id)
+        return entry[1] if entry else None
+
+    def dumps(self):
+        """Return the queue as one CSV field: "member_id[@expiry]" entries separated by ";"."""
+        return ";".join(
+            f"{member_id}@{expires.isoformat()}" if expires else member_id
+            for member_id, expires in self.items())
+
+    @staticmethod
+    def loads(field):
+        """Return the (member_id, expires) pairs of a field written by dumps()."""
+        entries = []
+        for entry in field.split(";"):
+            member_id, _, expires = entry.partition("@")
+            entries.append((member_id, datetime.date.fromisoformat(expires) if expires else None))
+        return entries
+
+    def position(self, member_id):
+        """Return a member's 1-based place in the queue, or None if they are not queued."""
+        entry = self.entries.get(member_id)
+        if entry is None:
+            return None
+        index = entry[0]
+        position = 0
+        while index > 0:
+            position += self.fenwick[index]
+            index -= index & -index
+        return position
+
+    def _bump(self, sequence, delta):
+        size = len(self.fenwick) - 1
+        while sequence <= size:
+            self.fenwick[sequence] += delta
+            sequence += sequence & -sequence
+
+    def _renumber(self):
+        # Sequence numbers ran past the tree: number the live entries 1..n again and
+        # size the tree to twice that, so this O(n) step is amortized over n appends
+        size = max(8, 2 * (len(self.entries) + 1))
+        self.fenwick = [0] * (size + 1)
+        self.next_sequence = 1
+        for member_id, (_, expires) in list(self.entries.items()):
+            self.entries[member_id] = (self.next_sequence, expires)
+            self._bump(self.next_sequence, 1)
+            self.next_sequence += 1
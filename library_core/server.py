@@ -0,0 +1,259 @@
+"""Circulation server: one Library shared by several desks over localhost TCP.
+
+The protocol is JSON lines. A desk sends {"id": 1, "op": "borrow", "args": {...}}
+and gets back {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false, "error": "..."}.
+
+    python -m library_core.server --port 8765
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import socket
+import threading
+
+from .library import Library
+from .storage import CSVStorage, PersistenceWorker
+
+logger = logging.getLogger(__name__)
+
+class ReadWriteLock:
+    """Many readers or one writer. Waiting writers block new readers, so writes are not starved."""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+
+    def acquire_read(self):
+        with self.condition:
+            while self.writing or self.waiting_writers:
+                self.condition.wait()
+            self.readers += 1
+
+    def release_read(self):
+        with self.condition:
+            self.readers -= 1
+            if not self.readers:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            self.waiting_writers += 1
+            while self.writing or self.readers:
+                self.condition.wait()
+            self.waiting_writers -= 1
+            self.writing = True
+
+    def release_write(self):
+        with self.condition:
+            self.writing = False
+            self.condition.notify_all()
+
+def _book(book):
+    return {
+        "book_id": book.book_id,
+        "title": book.title,
+        "author": book.author,
+        "available": book.available,
+        "borrowed_by": book.borrowed_by,
+        "due_date": book.due_date.isoformat() if book.due_date else None,
+        "borrow_count": book.borrow_count,
+        "waiting": len(book.waiting_list),
+    }
+
+def _loan(entry):
+    book_id, title, due_date = entry
+    return {"book_id": book_id, "title": title, "due_date": due_date.isoformat() if due_date else None}
+
+# op -> handler(library, **args). Reads run concurrently, writes one at a time.
+READS = {
+    "get_book": lambda library, book_id: _book(library.book_index[book_id]) if book_id in library.book_index else None,
+    "search": lambda library, query, include_author=False, limit=100:
+        [_book(book) for book in library.search_books(query, include_author)[:limit]],
+    "list_books": lambda library, offset=0, limit=100: [_book(book) for book in library.books.page(offset, limit)],
+    "available_books": lambda library, offset=0, limit=100:
+        [_book(book) for book in library.available_books(offset, limit)],
+    "count_available": lambda library, title=None, author=None: library.count_available(title, author),
+    "search_members": lambda library, query, offset=0, limit=100:
+        [{"member_id": member.member_id, "name": member.name} for member in library.search_members(query, offset, limit)],
+    "member_loans": lambda library, member_id: [_loan(entry) for entry in library.member_loans(member_id)],
+    "most_borrowed": lambda library, top_n=5: [_book(book) for book in library.get_most_borrowed_books(top_n)],
+    "reservation_position": lambda library, book_id, member_id: library.reservation_position(book_id, member_id),
+}
+WRITES = {
+    "add_book": lambda library, title, author: library.add_book(title, author),
+    "remove_book": lambda library, book_id: library.remove_book(book_id),
+    "remove_books": lambda library, book_ids: library.remove_books(book_ids),
+    "add_member": lambda library, name: library.add_member(name),
+    "remove_member": lambda library, member_id: library.remove_member(member_id),
+    "borrow": lambda library, title, member_id, days=14: library.borrow_book(title, member_id, days),
+    "return": lambda library, book_id, member_id: library.return_book(book_id, member_id),
+    "cancel_reservation": lambda library, book_id, member_id: library.cancel_reservation(book_id, member_id),
+    "borrow_many": lambda library, requests, days=14: library.borrow_many(requests, days),
+    "return_many": lambda library, returns: library.return_many(returns),
+}
+
+class LibraryServer:
+    """Serves one Library to many desks.
+
+    Writes go through a single writer thread, so they apply in arrival order and
+    none is lost. Reads run on a pool of threads alongside each other. The lock
+    keeps reads out while a write is half-applied. After every write the lazily
+    maintained indexes are brought up to date, so that reads never modify them.
+    Desks are answered before their changes reach the disk. If the library's storage
+    is a PersistenceWorker (open it before creating the server), its write errors
+    are logged as they come in.
+    """
+
+    def __init__(self, library, host="127.0.0.1", port=8765, readers=8):
+        self.library = library
+        self.host = host
+        self.port = port
+        self.lock = ReadWriteLock()
+        self.read_pool = concurrent.futures.ThreadPoolExecutor(readers, thread_name_prefix="library-read")
+        self.writer = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix="library-write")
+        self.server = None
+        self.storage_errors = getattr(library.storage, "errors", None)  # Set by a PersistenceWorker
+        self.reporter = None
+        library.settle()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve_desk, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]  # The real port when started with port=0
+        self.reporter = asyncio.create_task(self._poll_storage_errors())
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.reporter is not None:
+            self.reporter.cancel()
+        self.read_pool.shutdown()
+        self.writer.shutdown()
+        self.report_storage_errors()
+
+    def report_storage_errors(self):
+        """Log the errors the library's background writer has put on its `errors` queue."""
+        errors = self.storage_errors
+        while errors is not None and not errors.empty():
+            logger.error("Library data could not be written to disk: %s", errors.get())
+
+    async def _poll_storage_errors(self, interval=0.5):
+        while True:
+            self.report_storage_errors()
+            await asyncio.sleep(interval)
+
+    async def _serve_desk(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self._dispatch(loop, line)
+                writer.write(json.dumps(response, separators=(",", ":")).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass  # Desk went away mid-request
+        finally:
+            writer.close()
+
+    async def _dispatch(self, loop, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            request_id = request.get("id")
+            op = request["op"]
+            args = request.get("args", {})
+            if not isinstance(args, dict):
+                raise ValueError("args must be a JSON object")
+            if op in READS:
+                result = await loop.run_in_executor(self.read_pool, self._read, READS[op], args)
+            elif op in WRITES:
+                result = await loop.run_in_executor(self.writer, self._write, WRITES[op], args)
+            else:
+                return {"id": request_id, "ok": False, "error": f"Unknown operation '{op}'"}
+        except (ValueError, KeyError, TypeError) as error:
+            return {"id": request_id, "ok": False, "error": f"Bad request: {error}"}
+        except Exception as error:  # A failed operation is reported; the desk stays connected
+            return {"id": request_id, "ok": False, "error": f"{type(error).__name__}: {error}"}
+        return {"id": request_id, "ok": True, "result": result}
+
+    def _read(self, handler, args):
+        self.lock.acquire_read()
+        try:
+            return handler(self.library, **args)
+        finally:
+            self.lock.release_read()
+
+    def _write(self, handler, args):
+        self.lock.acquire_write()
+        try:
+            result = handler(self.library, **args)
+            self.library.settle()
+            return result
+        finally:
+            self.lock.release_write()
+
+class ServerError(Exception):
+    """The server rejected a request."""
+
+class LibraryClient:
+    """Blocking client for one desk. Not thread-safe; give each thread its own client."""
+
+    def __init__(self, host="127.0.0.1", port=8765, timeout=30):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.file = self.sock.makefile("rwb")
+        self.next_id = 1
+
+    def call(self, op, **args):
+        """Run one operation on the server and return its result."""
+        request_id = self.next_id
+        self.next_id += 1
+        request = {"id": request_id, "op": op, "args": args}
+        self.file.write(json.dumps(request, separators=(",", ":")).encode("utf-8") + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("Server closed the connection")
+        response = json.loads(line)
+        if not response["ok"]:
+            raise ServerError(response["error"])
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the library to circulation desks on this machine.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s")
+
+    library = Library()
+    library.open_storage(PersistenceWorker(CSVStorage()))
+    server = LibraryServer(library, args.host, args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        library.close()
+        server.report_storage_errors()  # From writing what was still queued
+
+if __name__ == "__main__":
+    main()
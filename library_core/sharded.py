@@ -0,0 +1,132 @@
+"""Multi-term catalog search fanned out over worker processes.
+
+The catalog is split into shards, each written once into a shared memory block as
+lowercase "book_id<US>title<US>author" lines. Every shard has a worker process of its
+own, which attaches to its block by name and keeps just that shard decoded, so the
+workers hold one copy of the catalog between them. A query does not pay to pickle the
+catalog, and the scan is not bound to the one core the GIL allows the main process.
+"""
+
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+
+from .catalog import BookBST
+from .indexes import match_score
+
+SEPARATOR = "\x1f"  # ASCII unit separator between fields, newline between books
+
+def _field(text):
+    # A search term never contains whitespace, so blanking these cannot change a match
+    return text.lower().replace("\n", " ").replace(SEPARATOR, " ")
+
+_shard = None  # Per worker process: (name, generation, decoded text) of the one shard it serves
+
+def _shard_text(name, size, generation):
+    global _shard
+    if _shard is None or _shard[:2] != (name, generation):
+        # First query, or the catalog was re-sharded: the old text is dropped
+        _shard = None
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            _shard = (name, generation, bytes(block.buf[:size]).decode("utf-8"))
+        finally:
+            block.close()
+    return _shard[2]
+
+def _search_shard(name, size, generation, terms, include_author):
+    """Return (score, book_id) for every line of one shard matching all `terms`. Runs in a worker."""
+    text = _shard_text(name, size, generation)
+    anchor = max(terms, key=len)  # The longest term usually has the fewest occurrences
+    matches = []
+    last_start = -1
+    position = text.find(anchor)
+    while position != -1:
+        start = text.rfind("\n", 0, position) + 1
+        end = text.find("\n", position)
+        if start != last_start:
+            last_start = start
+            book_id, title, author = text[start:end].split(SEPARATOR)
+            score = match_score(terms, title, author, include_author)
+            if score:
+                matches.append((score, book_id))
+        position = text.find(anchor, end)
+    return matches
+
+class ShardedSearch:
+    """Searches a snapshot of a Library's catalog on a process pool.
+
+    Books added after the snapshot are searched in-process until there are
+    `rebuild_after` of them, then the shards are rebuilt. Titles and authors never
+    change, and removed books are dropped when results are mapped back to Books.
+    """
+
+    rebuild_after = 10000
+
+    def __init__(self, library, workers=None):
+        self.library = library
+        self.workers = workers or os.cpu_count() or 1
+        # One single-process pool per shard, so that each shard always goes to the same process
+        self.pools = [concurrent.futures.ProcessPoolExecutor(1) for _ in range(self.workers)]
+        self.blocks = []  # (SharedMemory, size) per shard
+        self.rows = 0     # Books in the shards
+        self.added = []   # Books added since the shards were built
+        self.generation = 0
+        self.scanned = 0  # Rows checked by searches so far, for metrics
+        library.subscribe(self._on_change)
+        self._build()
+
+    def _build(self):
+        self._release()
+        self.generation += 1
+        books = self.library.books.in_order()
+        shard_size = -(-len(books) // self.workers) or 1
+        for lo in range(0, len(books), shard_size):
+            data = "".join(
+                f"{book.book_id}{SEPARATOR}{_field(book.title)}{SEPARATOR}{_field(book.author)}\n"
+                for book in books[lo:lo + shard_size]
+            ).encode("utf-8")
+            block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+            block.buf[:len(data)] = data
+            self.blocks.append((block, len(data)))
+        self.rows = len(books)
+        self.added = []
+
+    def _on_change(self, event, item):
+        changes = item if event == "batch" else [(event, item)]
+        self.added.extend(book for event, book in changes if event == "book_added")
+
+    def search(self, terms, include_author=False):
+        """Return the books matching every one of the lowercase `terms`, best first, then in title order."""
+        if len(self.added) > self.rebuild_after:
+            self._build()
+        futures = [pool.submit(_search_shard, block.name, size, self.generation, terms, include_author)
+                   for pool, (block, size) in zip(self.pools, self.blocks)]
+        self.scanned += self.rows + len(self.added)
+        book_index = self.library.book_index
+        scored = []
+        for future in futures:
+            for score, book_id in future.result():
+                book = book_index.get(book_id)
+                if book is not None:
+                    scored.append((score, book))
+        for book in self.added:
+            if book_index.get(book.book_id) is not book:
+                continue  # Removed again
+            score = match_score(terms, book.title.lower(), book.author.lower(), include_author)
+            if score:
+                scored.append((score, book))
+        scored.sort(key=lambda pair: (-pair[0],) + BookBST._key(pair[1]))
+        return [book for score, book in scored]
+
+    def _release(self):
+        for block, _ in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def close(self):
+        self.library.unsubscribe(self._on_change)
+        for pool in self.pools:
+            pool.shutdown()
+        self._release()
@@ -0,0 +1,277 @@
+"""Binary catalog snapshots that open through mmap.
+
+Layout, all little-endian: a header (magic, format version, counts, next IDs and
+the offset and length of every section), then 8-byte aligned sections:
+
+    book_ids       int64[n]    numeric book IDs, in catalog (title) order
+    title_offsets  uint64[n+1] byte offset of each title in the title heap
+    titles         bytes       UTF-8 titles, each followed by a NUL
+    author_refs    uint32[n]   index of each book's author in the author heap
+    authors        bytes       UTF-8 distinct authors, each followed by a NUL
+    available      uint8[n]
+    borrow_counts  uint32[n]
+    due_dates      int32[n]    date.toordinal(), 0 when not on loan
+    borrowed_by    int64[n]    numeric member ID, -1 when not on loan
+    id_order       uint32[n]   catalog positions sorted by book ID
+    prefix_order   uint32[n]   catalog positions sorted by lowercase title
+    members        bytes       "member_id<US>name<US>books_borrowed" records, each followed by a NUL
+    waitlists      bytes       "book_id<US>WaitingList.dumps()" records, each followed by a NUL
+
+The rows are already in the order the catalog tree and the prefix index need, so
+loading sorts nothing. Snapshot also gives random access to single books without
+loading the rest.
+
+    python -m library_core.snapshot import books.csv members.csv library.snap
+    python -m library_core.snapshot export library.snap books.csv members.csv
+"""
+
+import array
+import bisect
+import datetime
+import mmap
+import os
+import struct
+import sys
+
+from .models import Book, Member
+from .reservations import WaitingList
+
+MAGIC = b"LIBSNAP\x00"
+VERSION = 1
+SECTIONS = ("book_ids", "title_offsets", "titles", "author_refs", "authors", "available", "borrow_counts",
+            "due_dates", "borrowed_by", "id_order", "prefix_order", "members", "waitlists")
+FORMATS = {"book_ids": "q", "title_offsets": "Q", "author_refs": "I", "available": "B",
+           "borrow_counts": "I", "due_dates": "i", "borrowed_by": "q", "id_order": "I", "prefix_order": "I"}
+HEADER = struct.Struct("<8sIIQQQQQ" + "QQ" * len(SECTIONS))
+SEPARATOR = "\x1f"
+
+if sys.byteorder != "little":
+    raise ImportError("binary snapshots are only supported on little-endian machines")
+
+def _number(text, what):
+    # IDs are stored as integers, so they must round-trip through int()
+    if text is None:
+        return -1
+    number = int(text)
+    if str(number) != text:
+        raise ValueError(f"{what} {text!r} cannot be stored in a binary snapshot")
+    return number
+
+def _heap(texts):
+    texts = list(texts)
+    for text in texts:
+        if "\x00" in text:
+            raise ValueError(f"{text!r} cannot be stored in a binary snapshot")
+    return "".join(text + "\x00" for text in texts).encode("utf-8")
+
+def _record(fields):
+    for field in fields:
+        if SEPARATOR in field:
+            raise ValueError(f"{field!r} cannot be stored in a binary snapshot")
+    return SEPARATOR.join(fields)
+
+def capture(library):
+    """Copy out everything a snapshot stores. Only reads the library, so it can run on the UI thread."""
+    books = library.books.in_order()
+    authors = {}
+    return {
+        "books": [(book.book_id, book.title, authors.setdefault(book.author, len(authors)), book.available,
+                   book.borrow_count, book.due_date, book.borrowed_by) for book in books],
+        "authors": list(authors),
+        "members": [(member.member_id, member.name, ",".join(member.books_borrowed))
+                    for member in library.members.values()],
+        "waitlists": [(book.book_id, library._saved_holds(book).dumps()) for book in books
+                      if book.waiting_list and library._saved_holds(book)],
+        "next_book_id": library.next_book_id,
+        "next_member_id": library.next_member_id,
+    }
+
+def encode(captured):
+    """Return the snapshot file contents for what capture() returned."""
+    rows = captured["books"]
+    titles = [row[1] for row in rows]
+    title_heap = _heap(titles)
+    title_offsets = array.array("Q", [0])
+    offset = 0
+    for title in titles:
+        offset += len(title.encode("utf-8")) + 1
+        title_offsets.append(offset)
+    book_ids = array.array("q", [_number(row[0], "Book ID") for row in rows])
+    lowered = [title.lower() for title in titles]
+    sections = {
+        "book_ids": book_ids.tobytes(),
+        "title_offsets": title_offsets.tobytes(),
+        "titles": title_heap,
+        "author_refs": array.array("I", [row[2] for row in rows]).tobytes(),
+        "authors": _heap(captured["authors"]),
+        "available": bytes(1 if row[3] else 0 for row in rows),
+        "borrow_counts": array.array("I", [row[4] for row in rows]).tobytes(),
+        "due_dates": array.array("i", [row[5].toordinal() if row[5] else 0 for row in rows]).tobytes(),
+        "borrowed_by": array.array("q", [_number(row[6], "Member ID") for row in rows]).tobytes(),
+        "id_order": array.array("I", sorted(range(len(rows)), key=book_ids.__getitem__)).tobytes(),
+        "prefix_order": array.array("I", sorted(range(len(rows)), key=lowered.__getitem__)).tobytes(),
+        "members": _heap(_record(member) for member in captured["members"]),
+        "waitlists": _heap(_record(entry) for entry in captured["waitlists"]),
+    }
+
+    layout = []
+    body = bytearray()
+    for name in SECTIONS:
+        body.extend(b"\x00" * (-(HEADER.size + len(body)) % 8))
+        layout.extend((HEADER.size + len(body), len(sections[name])))
+        body.extend(sections[name])
+    header = HEADER.pack(MAGIC, VERSION, 0, len(rows), len(captured["members"]), len(captured["authors"]),
+                         captured["next_book_id"], captured["next_member_id"], *layout)
+    return header + body
+
+def write(filename, captured):
+    """Write a snapshot atomically, like write_csv. Returns the size of the file written."""
+    data = encode(captured)
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, mode="wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filename, filename)
+    return len(data)
+
+class Snapshot:
+    """A snapshot file mapped into memory. Columns are read in place; Books are built on request."""
+
+    def __init__(self, filename):
+        with open(filename, mode="rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        fields = HEADER.unpack_from(self.map)
+        magic, version, _, self.book_count, self.member_count, self.author_count, \
+            self.next_book_id, self.next_member_id = fields[:8]
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{filename} is not a library snapshot")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"{filename} is snapshot version {version}; this code reads version {VERSION}")
+        self.sections = {}
+        layout = fields[8:]
+        for index, name in enumerate(SECTIONS):
+            offset, length = layout[2 * index], layout[2 * index + 1]
+            section = self.view[offset:offset + length]
+            if name in FORMATS:
+                section = section.cast(FORMATS[name])
+            self.sections[name] = section
+        self.authors = None  # Decoded on first use
+
+    def __len__(self):
+        return self.book_count
+
+    def book(self, position):
+        """Build the Book at a catalog position (0 is the first in title order)."""
+        sections = self.sections
+        start, end = sections["title_offsets"][position], sections["title_offsets"][position + 1]
+        title = bytes(sections["titles"][start:end - 1]).decode("utf-8")
+        if self.authors is None:
+            self.authors = _split(sections["authors"])
+        book = Book(title, self.authors[sections["author_refs"][position]], str(sections["book_ids"][position]))
+        _set_state(book, sections, position)
+        return book
+
+    def page(self, offset, limit):
+        """Build up to `limit` Books in title order, starting at position `offset`."""
+        return [self.book(position) for position in range(offset, min(offset + limit, self.book_count))]
+
+    def find(self, book_id):
+        """Build the Book with this ID, or return None, by binary search over the prebuilt ID order."""
+        position = self._position(book_id)
+        return None if position is None else self.book(position)
+
+    def _position(self, book_id):
+        try:
+            number = int(book_id)
+        except ValueError:
+            return None
+        ids, order = self.sections["book_ids"], self.sections["id_order"]
+        index = bisect.bisect_left(range(self.book_count), number, key=lambda i: ids[order[i]])
+        if index < self.book_count and ids[order[index]] == number:
+            return order[index]
+        return None
+
+    def load_into(self, library):
+        """Add every member and book to an empty `library`, in bulk."""
+        sections = self.sections
+        with library._bulk_loading():
+            for record in _split(sections["members"]):
+                member_id, name, books_borrowed = record.split(SEPARATOR)
+                member = Member(name, member_id)
+                member.books_borrowed = books_borrowed.split(",") if books_borrowed else []
+                library.members[member_id] = member
+            library.member_directory = None  # Rebuilt with the loaded members on the next search
+
+            # Whole columns are decoded by C code in one go; only books that differ from a
+            # new Book (on loan, borrowed before) are touched one by one
+            authors = [sys.intern(author) for author in _split(sections["authors"])]
+            books = list(map(Book, _split(sections["titles"]),
+                             map(authors.__getitem__, sections["author_refs"]),
+                             map(str, sections["book_ids"])))
+            available = bytes(sections["available"])
+            position = available.find(0)
+            while position != -1:
+                _set_state(books[position], sections, position)
+                position = available.find(0, position + 1)
+            for book, count in zip(books, sections["borrow_counts"]):
+                if count:
+                    book.borrow_count = count
+
+            for record in _split(sections["waitlists"]):
+                book_id, field = record.split(SEPARATOR)
+                book = books[self._position(book_id)]
+                for member_id, expires in WaitingList.loads(field):
+                    book.reserve(member_id, expires)
+
+            prefix_order = list(map(books.__getitem__, sections["prefix_order"]))
+            library._load_books(books, in_order=True, prefix_order=prefix_order)
+            library.next_book_id = max(library.next_book_id, self.next_book_id)
+            library.next_member_id = max(library.next_member_id, self.next_member_id)
+
+    def close(self):
+        for section in getattr(self, "sections", {}).values():
+            section.release()
+        self.view.release()
+        self.map.close()
+
+def _split(section):
+    """Decode a heap section into its NUL-terminated strings."""
+    texts = bytes(section).decode("utf-8").split("\x00")
+    texts.pop()  # Empty string after the last terminator
+    return texts
+
+def _set_state(book, sections, position):
+    book.available = bool(sections["available"][position])
+    book.borrow_count = sections["borrow_counts"][position]
+    if sections["due_dates"][position]:
+        book.due_date = datetime.date.fromordinal(sections["due_dates"][position])
+    if sections["borrowed_by"][position] >= 0:
+        book.borrowed_by = str(sections["borrowed_by"][position])
+
+def main(argv=None):
+    from .library import Library  # Not needed just to read snapshots
+
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) == 4 and argv[0] == "import":
+        library = Library()
+        library.load_members_from_csv(argv[2])
+        library.load_books_from_csv(argv[1])
+        write(argv[3], capture(library))
+    elif len(argv) == 4 and argv[0] == "export":
+        library = Library()
+        snapshot = Snapshot(argv[1])
+        snapshot.load_into(library)
+        snapshot.close()
+        library.save_books_to_csv(argv[2])
+        library.save_members_to_csv(argv[3])
+    else:
+        print("usage:\n" + "\n".join(__doc__.strip().splitlines()[-2:]), file=sys.stderr)
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
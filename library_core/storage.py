@@ -0,0 +1,509 @@
+import csv
+import datetime
+import json
+import os
+import queue
+import threading
+
+def write_csv(filename, rows):
+    """Write rows to a CSV file atomically: a temp file is synced to disk, then renamed over it.
+
+    Returns the size of the file written.
+    """
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, mode="w", newline="") as file:
+        csv.writer(file).writerows(rows)
+        file.flush()
+        os.fsync(file.fileno())
+        size = file.tell()
+    os.replace(temp_filename, filename)  # Never leave a half-written snapshot behind
+    return size
+
+class Journal:
+    """Append-only log of library mutations, one JSON record per line.
+
+    Records carry the resulting state (e.g. the new borrow_count), so replaying a
+    record that is already reflected in the CSV snapshot is harmless.
+    """
+
+    def __init__(self, filename="library.journal", fsync=True):
+        self.filename = filename
+        self.fsync = fsync
+        self.file = None
+        self._valid_size = 0
+        self.bytes_written = 0  # Running total, for metrics
+
+    def read(self):
+        """Return every complete record, stopping at a torn write left by a crash."""
+        records = []
+        self._valid_size = 0
+        try:
+            with open(self.filename, mode="rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+                    self._valid_size += len(line)
+        except FileNotFoundError:
+            pass
+        return records
+
+    def open(self):
+        self.file = open(self.filename, mode="a", encoding="utf-8")
+        self.file.truncate(self._valid_size)  # Drop any torn tail so new records start on a clean line
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Append a batch of records with a single write and sync."""
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+        try:
+            if self.file is None:
+                self.open()  # Reopening after the last failure failed too
+            self.file.write(data)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+        except OSError:
+            self._drop_torn_tail()
+            raise
+        self._valid_size += len(data)  # json.dumps escapes non-ASCII, so characters are bytes
+        self.bytes_written += len(data)
+
+    def _drop_torn_tail(self):
+        # A failed write (e.g. a full disk) may have left part of a line behind. Cut the
+        # journal back to its last complete record, so a retry does not append after it
+        try:
+            self.file.close()
+        except OSError:
+            pass  # Flushing the rest of the failed write; truncated away below
+        self.file = None
+        self.open()
+
+    def rewrite(self, records):
+        """Atomically replace the journal with `records` (used after compaction)."""
+        self.close()
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, mode="w", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_filename, self.filename)
+        self._valid_size = os.path.getsize(self.filename)
+        self.bytes_written += self._valid_size
+        self.open()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class CSVStorage:
+    """Storage backend: CSV snapshots plus a journal of the changes made since the last snapshot."""
+
+    snapshot_replaces_log = True  # A snapshot holds every change made before it was captured
+
+    def __init__(self, books_file="books.csv", members_file="members.csv",
+                 journal_file="library.journal", fsync=True):
+        self.books_file = books_file
+        self.members_file = members_file
+        self.journal = Journal(journal_file, fsync=fsync)
+        self.snapshot_bytes = 0
+
+    @property
+    def bytes_written(self):
+        """Bytes written to the journal and CSV snapshots so far."""
+        return self.journal.bytes_written + self.snapshot_bytes
+
+    def load(self, library):
+        library.load_members_from_csv(self.members_file)
+        library.load_books_from_csv(self.books_file)
+        records = self.journal.read()
+        for record in records:
+            library.replay(record)
+        library.changes = len(records)
+        self.journal.open()
+
+    def record(self, record):
+        self.journal.append(record)
+
+    def record_many(self, records):
+        self.journal.append_many(records)
+
+    def snapshot(self, library):
+        """Capture everything compaction will write: O(catalog), but disk-free, so it can run on the UI thread."""
+        return library.book_rows(), library.member_rows(), library.next_ids()
+
+    def write_snapshot(self, snapshot):
+        """Write fresh CSV snapshots and start a new, short journal.
+
+        The CSV files have no room for the ID counters, so the new journal starts with
+        them; otherwise weeding the newest book would hand its ID out again.
+        """
+        book_rows, member_rows, next_ids = snapshot
+        self.snapshot_bytes += write_csv(self.books_file, book_rows)
+        self.snapshot_bytes += write_csv(self.members_file, member_rows)
+        self.journal.rewrite([next_ids])
+
+    def compact(self, library):
+        """Fold the journal into fresh CSV snapshots."""
+        self.write_snapshot(self.snapshot(library))
+
+    def close(self):
+        self.journal.close()
+
+class SnapshotStorage(CSVStorage):
+    """CSVStorage with a binary snapshot (see snapshot.py) in place of the CSV files.
+
+    Until the first compaction, or if the snapshot is missing, it loads the CSV files,
+    so an existing library switches over without a conversion step.
+    """
+
+    def __init__(self, snapshot_file="library.snap", books_file="books.csv", members_file="members.csv",
+                 journal_file="library.journal", fsync=True):
+        super().__init__(books_file, members_file, journal_file, fsync)
+        self.snapshot_file = snapshot_file
+
+    def load(self, library):
+        from . import snapshot  # Only loaded by libraries that use binary snapshots
+
+        if not os.path.exists(self.snapshot_file):
+            super().load(library)
+            return
+        mapped = snapshot.Snapshot(self.snapshot_file)
+        try:
+            mapped.load_into(library)
+        finally:
+            mapped.close()
+        records = self.journal.read()
+        for record in records:
+            library.replay(record)
+        library.changes = len(records)
+        self.journal.open()
+
+    def preview(self):
+        """Map the snapshot for a first look at the catalog before load(), or return None if there is none.
+
+        Snapshot.page() builds only the Books asked for, so a view can show its first rows
+        straight away. Changes journaled since the snapshot are not in it. Close it when done.
+        """
+        from . import snapshot
+
+        if not os.path.exists(self.snapshot_file):
+            return None
+        return snapshot.Snapshot(self.snapshot_file)
+
+    def snapshot(self, library):
+        from . import snapshot
+
+        return snapshot.capture(library)
+
+    def write_snapshot(self, snapshot):
+        """Write a fresh binary snapshot and start a new, short journal."""
+        from . import snapshot as binary
+
+        self.snapshot_bytes += binary.write(self.snapshot_file, snapshot)
+        self.journal.rewrite([])
+
+class SQLiteStorage:
+    """Storage backend on a SQLite database: every change is a single-row transaction.
+
+    Besides loading the Library, it can answer searches and reports directly in SQL
+    (search, most_borrowed, overdue, loans) without touching the in-memory catalog.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            book_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            available INTEGER NOT NULL DEFAULT 1,
+            borrowed_by TEXT,
+            due_date TEXT,
+            borrow_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS members (
+            member_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS waitlist (
+            position INTEGER PRIMARY KEY AUTOINCREMENT,
+            book_id TEXT NOT NULL,
+            member_id TEXT NOT NULL,
+            expires TEXT
+        );
+        CREATE INDEX IF NOT EXISTS books_title ON books (title);
+        CREATE INDEX IF NOT EXISTS books_author ON books (author);
+        CREATE INDEX IF NOT EXISTS books_borrowed_by ON books (borrowed_by);
+        CREATE INDEX IF NOT EXISTS books_due_date ON books (due_date);
+        CREATE INDEX IF NOT EXISTS waitlist_book ON waitlist (book_id);
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, filename="library.db"):
+        import sqlite3  # Imported lazily so the headless core stays cheap to import
+
+        self.filename = filename
+        # The connection may be driven from a PersistenceWorker thread; self.lock serializes its use
+        self.conn = sqlite3.connect(filename, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(waitlist)")}
+        if "expires" not in columns:
+            self.conn.execute("ALTER TABLE waitlist ADD COLUMN expires TEXT")  # Databases from before hold expiry
+
+    def load(self, library):
+        for member_id, name in self.conn.execute("SELECT member_id, name FROM members"):
+            library._apply_add_member(member_id, name)
+        rows = self.conn.execute(
+            "SELECT book_id, title, author, borrowed_by, due_date, borrow_count FROM books")
+        for book_id, title, author, borrowed_by, due_date, borrow_count in rows:
+            library._apply_add_book(book_id, title, author)
+            book = library.book_index[book_id]
+            library._set_borrow_count(book, borrow_count)
+            if borrowed_by is not None:
+                library._apply_borrow(book, borrowed_by, datetime.date.fromisoformat(due_date), borrow_count)
+        waitlist = self.conn.execute("SELECT book_id, member_id, expires FROM waitlist ORDER BY position")
+        for book_id, member_id, expires in waitlist:
+            book = library.book_index.get(book_id)
+            if book is not None:
+                library._work_for(book).reserve(member_id, expires and datetime.date.fromisoformat(expires))
+        library.replay(dict(self.conn.execute("SELECT name, value FROM counters"), op="next_ids"))
+
+    def record(self, record):
+        self.record_many([record])
+
+    def record_many(self, records):
+        """Apply a batch of change records in one transaction."""
+        with self.lock, self.conn:
+            for record in records:
+                self._apply(record)
+
+    def _apply(self, record):
+        op = record["op"]
+        if op == "add_book":
+            self.conn.execute(
+                "INSERT OR IGNORE INTO books (book_id, title, author) VALUES (?, ?, ?)",
+                (record["book_id"], record["title"], record["author"]))
+            self._raise_counter("next_book_id", int(record["book_id"]) + 1)
+        elif op == "add_member":
+            self.conn.execute(
+                "INSERT OR IGNORE INTO members (member_id, name) VALUES (?, ?)",
+                (record["member_id"], record["name"]))
+            self._raise_counter("next_member_id", int(record["member_id"]) + 1)
+        elif op == "delete_member":
+            self.conn.execute("DELETE FROM members WHERE member_id = ?", (record["member_id"],))
+        elif op == "borrow":
+            self.conn.execute(
+                "UPDATE books SET available = 0, borrowed_by = ?, due_date = ?, borrow_count = ? WHERE book_id = ?",
+                (record["member_id"], record["due_date"], record["borrow_count"], record["book_id"]))
+        elif op == "return":
+            self.conn.execute(
+                "UPDATE books SET available = 1, borrowed_by = NULL, due_date = NULL "
+                "WHERE book_id = ? AND borrowed_by = ?",
+                (record["book_id"], record["member_id"]))
+        elif op == "enqueue":
+            self.conn.execute(
+                "INSERT INTO waitlist (book_id, member_id, expires) SELECT ?, ?, ? WHERE NOT EXISTS "
+                "(SELECT 1 FROM waitlist WHERE book_id = ? AND member_id = ?)",
+                (record["book_id"], record["member_id"], record.get("expires"),
+                 record["book_id"], record["member_id"]))
+        elif op == "dequeue":
+            # The queue is shared by every copy of the title, and rows written before it
+            # was may sit under any of them
+            self.conn.execute(
+                "DELETE FROM waitlist WHERE member_id = ? AND book_id IN "
+                "(SELECT book_id FROM books WHERE title = (SELECT title FROM books WHERE book_id = ?))",
+                (record["member_id"], record["book_id"]))
+        elif op == "remove_book":
+            # Holds filed under the weeded copy move to another copy of the title, if one is left
+            other = self.conn.execute(
+                "SELECT other.book_id FROM books AS weeded JOIN books AS other ON other.title = weeded.title "
+                "WHERE weeded.book_id = ? AND other.book_id != weeded.book_id "
+                "ORDER BY length(other.book_id), other.book_id LIMIT 1",
+                (record["book_id"],)).fetchone()
+            if other is not None:
+                self.conn.execute("UPDATE waitlist SET book_id = ? WHERE book_id = ?", (other[0], record["book_id"]))
+            else:
+                self.conn.execute("DELETE FROM waitlist WHERE book_id = ?", (record["book_id"],))
+            self.conn.execute("DELETE FROM books WHERE book_id = ?", (record["book_id"],))
+
+    def _raise_counter(self, name, value):
+        # IDs are never handed out twice, even after the newest book or member is removed
+        self.conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET value = MAX(value, excluded.value)", (name, value))
+
+    def import_library(self, library):
+        """Replace the database contents with the state of `library` (e.g. one loaded from CSV)."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM books")
+            self.conn.execute("DELETE FROM members")
+            self.conn.execute("DELETE FROM waitlist")
+            self.conn.execute("DELETE FROM counters")
+            self.conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?)",
+                (("next_book_id", library.next_book_id), ("next_member_id", library.next_member_id)))
+            self.conn.executemany(
+                "INSERT INTO members (member_id, name) VALUES (?, ?)",
+                ((member.member_id, member.name) for member in library.members.values()))
+            books = library.books.in_order()
+            self.conn.executemany(
+                "INSERT INTO books VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((book.book_id, book.title, book.author, int(book.available), book.borrowed_by,
+                  book.due_date.isoformat() if book.due_date else None, book.borrow_count)
+                 for book in books))
+            self.conn.executemany(
+                "INSERT INTO waitlist (book_id, member_id, expires) VALUES (?, ?, ?)",
+                ((book.book_id, member_id, expires.isoformat() if expires else None)
+                 for book in books for member_id, expires in library._saved_holds(book).items()))
+
+    def search(self, query, include_author=False):
+        """Return (book_id, title, author, available) rows whose title (or author) contains `query`."""
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        sql = "SELECT book_id, title, author, available FROM books WHERE title LIKE ? ESCAPE '\\'"
+        params = [pattern]
+        if include_author:
+            sql += " OR author LIKE ? ESCAPE '\\'"
+            params.append(pattern)
+        with self.lock:
+            return self.conn.execute(sql + " ORDER BY title", params).fetchall()
+
+    def most_borrowed(self, top_n=5):
+        """Return (book_id, title, author, borrow_count) rows for the top N most borrowed books."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT book_id, title, author, borrow_count FROM books ORDER BY borrow_count DESC LIMIT ?",
+                (top_n,)).fetchall()
+
+    def overdue(self, as_of=None):
+        """Return (book_id, title, borrowed_by, due_date) rows for loans due before `as_of` (default today)."""
+        as_of = as_of or datetime.date.today()
+        with self.lock:
+            return self.conn.execute(
+                "SELECT book_id, title, borrowed_by, due_date FROM books "
+                "WHERE due_date IS NOT NULL AND due_date < ? ORDER BY due_date",
+                (as_of.isoformat(),)).fetchall()
+
+    def loans(self, member_id):
+        """Return (book_id, title, due_date) rows for the books on loan to a member."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT book_id, title, due_date FROM books WHERE borrowed_by = ? ORDER BY title",
+                (member_id,)).fetchall()
+
+    snapshot_replaces_log = False  # Changes only reach the database through record_many()
+
+    def snapshot(self, library):
+        return None  # Every recorded change is already in the database
+
+    def write_snapshot(self, snapshot):
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def compact(self, library):
+        self.write_snapshot(None)
+
+    def close(self):
+        self.conn.close()
+
+class PersistenceWorker:
+    """Wraps a storage backend and does all of its disk I/O on a background thread.
+
+    record() only queues the change. The thread drains whatever has piled up and
+    writes it as one batch (one journal write and sync, or one SQLite transaction).
+    Compaction snapshots are captured on the calling thread, so they are consistent,
+    and written by the worker. Write errors are put on `errors` for the UI thread to
+    report, and a failed batch is retried with the next one.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.queue = queue.Queue()
+        self.errors = queue.Queue()
+        self.thread = None
+        self._retry = []  # Records from a failed batch
+
+    def preview(self):
+        """The backend's preview() (see SnapshotStorage), or None if it has none."""
+        return self.storage.preview() if hasattr(self.storage, "preview") else None
+
+    def load(self, library):
+        self.storage.load(library)
+        self.thread = threading.Thread(target=self._run, name="library-persistence", daemon=True)
+        self.thread.start()
+
+    def record(self, record):
+        self.queue.put(("record", record))
+
+    def record_many(self, records):
+        self.queue.put(("records", records))
+
+    def compact(self, library):
+        self.queue.put(("snapshot", self.storage.snapshot(library)))
+
+    def flush(self):
+        """Block until everything queued so far has been written (or has failed)."""
+        self.queue.join()
+
+    def close(self):
+        """Write everything still queued, stop the thread and close the backend."""
+        self.queue.put(("stop", None))
+        self.thread.join()
+        self.storage.close()
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            # Coalesce everything else that piled up while the last batch was being written
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._write(items)
+            for _ in items:
+                self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, items):
+        records = self._retry
+        self._retry = []
+        stop = False
+        for kind, payload in items:
+            if kind == "record":
+                records.append(payload)
+            elif kind == "records":
+                records.extend(payload)
+            elif kind == "snapshot":
+                if not self.storage.snapshot_replaces_log:
+                    # The snapshot only covers what the backend was given; write the rest first
+                    if records and self._attempt(self.storage.record_many, records):
+                        records = []
+                    self._attempt(self.storage.write_snapshot, payload)
+                elif self._attempt(self.storage.write_snapshot, payload):
+                    records = []  # Already part of the snapshot
+            else:
+                stop = True
+        if records and not self._attempt(self.storage.record_many, records):
+            self._retry = records
+        return stop
+
+    def _attempt(self, write, payload):
+        try:
+            write(payload)
+            return True
+        except Exception as error:  # Reported to the UI thread; the worker must keep running
+            self.errors.put(error)
+            return False
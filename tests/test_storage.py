@@ -0,0 +1,85 @@
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from library_core import CSVStorage, Library, PersistenceWorker, SQLiteStorage
+
+class FullDisk:
+    """Stands in for the journal's file: writes the first `partial` bytes, then fails like a full disk."""
+
+    def __init__(self, file, partial=10):
+        self.file = file
+        self.partial = partial
+
+    def write(self, data):
+        self.file.write(data[:self.partial])
+        self.file.flush()
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    def close(self):
+        self.file.close()
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def storage(self):
+        path = lambda name: os.path.join(self.directory, name)
+        return CSVStorage(path("books.csv"), path("members.csv"), path("library.journal"), fsync=False)
+
+    def test_retry_after_torn_write(self):
+        library = Library()
+        worker = PersistenceWorker(self.storage())
+        library.open_storage(worker)
+        journal = worker.storage.journal
+        journal.file = FullDisk(journal.file)
+
+        first = library.add_book("Dune", "Frank Herbert")
+        worker.flush()
+        self.assertFalse(worker.errors.empty())  # The torn write was reported
+        second = library.add_book("Emma", "Jane Austen")  # Retried together with the failed record
+        worker.flush()
+
+        # Restart from the journal alone, as after a crash
+        worker.queue.put(("stop", None))
+        worker.thread.join()
+        journal.close()
+        restarted = Library()
+        restarted.open_storage(self.storage())
+        self.assertEqual(sorted(restarted.book_index), sorted([first, second]))
+        restarted.close()
+
+class NextIdTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def check_not_reused(self, make_storage):
+        library = Library()
+        library.open_storage(make_storage())
+        library.add_book("Dune", "Frank Herbert")
+        newest = library.add_book("Emma", "Jane Austen")
+        member_id = library.add_member("Ann")
+        library.remove_book(newest)
+        library.remove_member(member_id)
+        library.close()  # Compacts, so the removals are no longer in a journal
+
+        reopened = Library()
+        reopened.open_storage(make_storage())
+        self.assertNotEqual(reopened.add_book("Ivanhoe", "Walter Scott"), newest)
+        self.assertNotEqual(reopened.add_member("Bo"), member_id)
+        reopened.close()
+
+    def test_csv(self):
+        path = lambda name: os.path.join(self.directory, name)
+        self.check_not_reused(lambda: CSVStorage(path("books.csv"), path("members.csv"),
+                                                 path("library.journal"), fsync=False))
+
+    def test_sqlite(self):
+        self.check_not_reused(lambda: SQLiteStorage(os.path.join(self.directory, "library.db")))
+
+if __name__ == "__main__":
+    unittest.main()